@@ -0,0 +1,164 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Throughput benchmarks of FEPParser.
+-------------------------------------
+For every size (windows x samples per window) a synthetic leg is written by fepGenerator, then timed:
+    parse_lines    fepWin.winYield, the line-by-line reader (MB/s)
+    parse_bulk     fepReader.readWindows, the byte-scanning reader (MB/s)
+    parse_cached   fepCache.loadWindows from a warm parse cache (MB/s of fepout)
+    bar            BARestimator.BARSC of one window pair (seconds per window)
+    histogram      Histogram.pairHist of one window pair (seconds per window)
+    end_to_end     read both files, pair the windows and solve BAR for all of them (seconds), with the error
+                   of the total free-energy change against the true one
+Every timing is the best of --repeat runs. The results are written as JSON, with the versions of Python and
+NumPy, the git revision and the machine, so that two runs can be compared with --compare.
+
+Usage:
+    python fepBenchmark.py [--sizes 20x20000,50x100000] [--repeat 3] [--output results.json] [--compare old.json]
+'''
+import os
+import sys
+import io
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+import BAR
+import Histogram
+import fepReader
+import fepCache
+from fepInterpretor import fepWin, winPair
+import fepGenerator
+
+DEFAULT_SIZES = '20x20000,50x100000'
+TEMPERATURE = 300.0
+# Metrics where larger is better; for the others (seconds) smaller is better.
+RATES = ('MB/s',)
+
+def _best(func, repeat):
+    '''
+    Best wall time of repeat calls of func, and the result of the last call. The messages printed are discarded.
+    '''
+    best = float('inf')
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def _pairs(fwd_wins, bwd_wins):
+    fwd = {w.label: w for w in fwd_wins}
+    return [winPair(fwd[w.label], w) for w in bwd_wins]
+
+def _endToEnd(fwd_name, bwd_name):
+    fwd_wins = list(fepWin.bulkYield(fwd_name, TEMPERATURE))
+    bwd_wins = list(fepWin.bulkYield(bwd_name, TEMPERATURE))
+    total = 0.0
+    for p in _pairs(fwd_wins, bwd_wins):
+        p.calcDF()
+        total += p.DF
+    return total
+
+def benchSize(nwin, nsamp, repeat, workdir):
+    '''
+    Run all the benchmarks on one synthetic leg. Return a list of result dictionaries.
+    '''
+    prefix = os.path.join(workdir, 'leg_%dx%d' % (nwin, nsamp))
+    (fwd_name, bwd_name, truth_name) = fepGenerator.writePair(prefix, nwin, nsamp, Temperature = TEMPERATURE)
+    with open(truth_name) as infile:
+        truth = json.load(infile)
+    MB = os.path.getsize(fwd_name) / 1e6
+    size = {'windows': nwin, 'samples': nsamp, 'file_MB': round(MB, 3)}
+    results = []
+    def record(name, value, unit, **extra):
+        results.append(dict(size, benchmark = name, value = value, unit = unit, **extra))
+
+    t, wins = _best(lambda: list(fepWin.winYield(fwd_name, TEMPERATURE)), repeat)
+    record('parse_lines', MB / t, 'MB/s', seconds = t)
+    t, recs = _best(lambda: list(fepReader.readWindows(fwd_name)), repeat)
+    record('parse_bulk', MB / t, 'MB/s', seconds = t)
+    cache_dir = os.path.join(workdir, 'cache')
+    list(fepCache.loadWindows(fwd_name, cache_dir = cache_dir)) # fill the cache
+    t, recs = _best(lambda: list(fepCache.loadWindows(fwd_name, cache_dir = cache_dir)), repeat)
+    record('parse_cached', MB / t, 'MB/s', seconds = t)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        pairs = _pairs(wins, list(fepWin.bulkYield(bwd_name, TEMPERATURE)))
+    p = pairs[len(pairs) // 2]
+    t, DF = _best(lambda: BAR.BARestimator(p.fwd_win.W_list, p.bwd_win.W_list, TEMPERATURE).BARSC(p.fwd_win.meanW), repeat)
+    record('bar', t, 's/window')
+    t, hist = _best(lambda: Histogram.pairHist(p.fwd_win.W_list, p.bwd_win.W_list, 250), repeat)
+    record('histogram', t, 's/window')
+
+    t, total = _best(lambda: _endToEnd(fwd_name, bwd_name), repeat)
+    record('end_to_end', t, 's', dF = total, dF_error = total - truth['dF_total'])
+    for name in (fwd_name, bwd_name, truth_name):
+        os.remove(name)
+    return results
+
+def environment():
+    try:
+        revision = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd = HERE, capture_output = True, text = True).stdout.strip()
+    except OSError:
+        revision = ''
+    return {'revision': revision, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'system': platform.system(), 'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def runBenchmarks(sizes = DEFAULT_SIZES, repeat = 3, workdir = None):
+    '''
+    Run the benchmarks at the given sizes ('NWINxNSAMP,...'). Return the report as a dictionary.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory(dir = workdir) as tmp:
+        for item in sizes.split(','):
+            (nwin, nsamp) = (int(n) for n in item.lower().split('x'))
+            print('Benchmarking %d windows x %d samples...' % (nwin, nsamp))
+            results.extend(benchSize(nwin, nsamp, repeat, tmp))
+    return {'environment': environment(), 'repeat': repeat, 'results': results}
+
+def compare(new, old):
+    '''
+    Print the speed of the new results relative to the old ones, for the benchmarks found in both.
+    A ratio above 1 is a speed-up.
+    '''
+    key = lambda r: (r['benchmark'], r['windows'], r['samples'])
+    before = {key(r): r for r in old['results']}
+    print('%-14s %14s %12s %12s %8s' % ('benchmark', 'size', 'old', 'new', 'speedup'))
+    for r in new['results']:
+        o = before.get(key(r))
+        if o is None:
+            continue
+        ratio = r['value'] / o['value'] if r['unit'] in RATES else o['value'] / r['value']
+        print('%-14s %14s %12.4g %12.4g %8.2f' % (r['benchmark'], '%dx%d' % (r['windows'], r['samples']), o['value'], r['value'], ratio))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the fepout readers and estimators.')
+    parser.add_argument('--sizes', default = DEFAULT_SIZES, help = 'comma separated NWINxNSAMP, default %s' % DEFAULT_SIZES)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--output', default = 'benchmark.json')
+    parser.add_argument('--compare', help = 'JSON file of an earlier run to compare with')
+    parser.add_argument('--workdir', help = 'where to write the synthetic files, default the system temporary directory')
+    args = parser.parse_args()
+    report = runBenchmarks(args.sizes, args.repeat, args.workdir)
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent = 1)
+    print('File %s written.' % args.output)
+    for r in report['results']:
+        print('%-14s %6dx%-8d %12.4g %s' % (r['benchmark'], r['windows'], r['samples'], r['value'], r['unit']))
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(report, json.load(infile))
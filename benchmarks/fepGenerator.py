@@ -0,0 +1,101 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Synthetic NAMD fepout files with known free-energy changes.
+-------------------------------------
+The work of every window is Gaussian. With forward work W_F ~ N(dF + beta*sigma^2/2, sigma) and backward
+work W_R ~ N(-dF + beta*sigma^2/2, sigma), the two distributions satisfy the Crooks relation, so dF is the
+exact free-energy change of the window and the estimators can be checked against it.
+The files follow the layout written by NAMD: the two header lines, then for every window the '#NEW FEP WINDOW'
+line, the equilibration lines, the FepEnergy lines (with the running dE_avg and dG) and the
+'#Free energy change' line.
+
+Usage:
+    python fepGenerator.py prefix nwin nsamp [--dF 10] [--sigma 0.8] [--temperature 300] [--seed 0]
+writes prefix.fwd.fepout, prefix.bwd.fepout and prefix.truth.json (the dF of every window).
+'''
+import json
+import argparse
+import numpy as np
+
+k_B = 0.001987200 # kcal/mol/K, as in BAR
+
+HEADER = ('#            STEP                 Elec                            vdW                    dE           dE_avg         Temperature             dG\n'
+          '#                           l             l+dl      l             l+dl         E(l+dl)-E(l)\n')
+LINE = 'FepEnergy: %6d %14.4f %14.4f %14.4f %14.4f %14.4f %14.4f %15.4f %14.4f\n'
+
+def windowDF(nwin, dF_total):
+    '''
+    Free-energy change of each of nwin windows, summing to dF_total. The changes vary smoothly over lambda,
+    larger at the ends of the path as is usual for decoupling.
+    '''
+    weights = 1.0 + 0.5 * np.cos(np.linspace(0, 2 * np.pi, nwin))
+    return dF_total * weights / weights.sum()
+
+def writeFepout(filename, lambdas, dFs, nsamp, direction, sigma = 0.8, Temperature = 300.0, seed = None, outfreq = 10):
+    '''
+    Write one fepout file.
+    -----------
+    lambdas: the nwin + 1 lambda values, from 0 to 1
+    dFs: free-energy change of each forward window
+    direction: 'fwd' (lambda from 0 to 1) or 'bwd' (from 1 to 0)
+    sigma: standard deviation of the work
+    outfreq: number of steps between two FepEnergy lines
+    '''
+    rng = np.random.default_rng(seed)
+    beta = 1.0 / (k_B * Temperature)
+    kT = k_B * Temperature
+    windows = list(zip(lambdas[:-1], lambdas[1:], dFs))
+    if direction == 'bwd':
+        windows = [(l2, l1, -dF) for (l1, l2, dF) in reversed(windows)]
+    net = 0.0
+    steps = outfreq * np.arange(1, nsamp + 1)
+    with open(filename, 'w') as outfile:
+        outfile.write(HEADER)
+        for (l1, l2, dF) in windows:
+            W = rng.normal(dF + 0.5 * beta * sigma * sigma, sigma, nsamp)
+            elec_l = rng.uniform(-120.0, -20.0, nsamp)
+            vdw_l = rng.normal(-15.0, 2.0, nsamp)
+            share = rng.uniform(0.2, 0.8, nsamp) # part of the work from elec
+            T = rng.normal(Temperature, 1.5, nsamp)
+            dE_avg = np.cumsum(W) / np.arange(1, nsamp + 1)
+            dG = -kT * (np.logaddexp.accumulate(-beta * W) - np.log(np.arange(1, nsamp + 1)))
+            rows = np.column_stack((steps, elec_l, elec_l + share * W, vdw_l, vdw_l + (1 - share) * W, W, dE_avg, T, dG))
+            outfile.write('#NEW FEP WINDOW: LAMBDA SET TO %g LAMBDA2 %g\n' % (l1, l2))
+            outfile.write('#%d STEPS OF EQUILIBRATION AT LAMBDA %g COMPLETED\n' % (0, l1))
+            outfile.write('#STARTING COLLECTION OF ENSEMBLE AVERAGE\n')
+            outfile.writelines(LINE % tuple(row) for row in rows.tolist())
+            net += dG[-1]
+            outfile.write('\n#Free energy change for lambda window [ %g %g ] is %.4f ; net change until now is %.4f\n' % (l1, l2, dG[-1], net))
+
+def writePair(prefix, nwin, nsamp, dF_total = 10.0, sigma = 0.8, Temperature = 300.0, seed = 0):
+    '''
+    Write the forward and backward fepout files of one leg, and the true dF of its windows.
+    Return the names of (forward file, backward file, truth file).
+    '''
+    lambdas = np.round(np.linspace(0.0, 1.0, nwin + 1), 6)
+    dFs = windowDF(nwin, dF_total)
+    seeds = np.random.SeedSequence(seed).spawn(2)
+    names = (prefix + '.fwd.fepout', prefix + '.bwd.fepout', prefix + '.truth.json')
+    writeFepout(names[0], lambdas, dFs, nsamp, 'fwd', sigma, Temperature, seeds[0])
+    writeFepout(names[1], lambdas, dFs, nsamp, 'bwd', sigma, Temperature, seeds[1])
+    with open(names[2], 'w') as outfile:
+        json.dump({'Temperature': Temperature, 'sigma': sigma, 'nsamp': nsamp, 'dF_total': float(dFs.sum()),
+                   'windows': [[float(lambdas[i]), float(lambdas[i + 1]), float(dFs[i])] for i in range(nwin)]}, outfile, indent = 1)
+    return names
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Write synthetic forward and backward fepout files.')
+    parser.add_argument('prefix')
+    parser.add_argument('nwin', type = int, help = 'number of windows')
+    parser.add_argument('nsamp', type = int, help = 'samples per window')
+    parser.add_argument('--dF', type = float, default = 10.0, help = 'total free-energy change, kcal/mol')
+    parser.add_argument('--sigma', type = float, default = 0.8, help = 'standard deviation of the work, kcal/mol')
+    parser.add_argument('--temperature', type = float, default = 300.0)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+    names = writePair(args.prefix, args.nwin, args.nsamp, args.dF, args.sigma, args.temperature, args.seed)
+    print('Files %s written.' % ', '.join(names))
@@ -0,0 +1,69 @@
+'''
+Check the bootstrap (bootstrap) and the decorrelation (autocorr):
+the replicates of a seed are the same whatever the number of workers, every replicate is the BAR solution of
+its resampled data, the bootstrap error is close to the asymptotic BAR error on uncorrelated data, and the
+statistical inefficiency of AR(1) series is close to its exact value (1 + phi) / (1 - phi).
+'''
+import os
+import sys
+import math
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import BAR
+import bootstrap
+import autocorr
+
+def ar1(phi, n, rng):
+    noise = rng.normal(0, 1, n)
+    x = np.empty(n)
+    x[0] = noise[0] / math.sqrt(1 - phi * phi)
+    for t in range(1, n):
+        x[t] = phi * x[t - 1] + noise[t]
+    return x
+
+if __name__ == '__main__':
+    T = 300
+    kT = BAR.k_B * T
+    (dF, sigma) = (1.5, 0.8)
+    rng = np.random.default_rng(1)
+    # Gaussian work obeying Crooks: W_F ~ N(dF + beta sigma^2 / 2, sigma), W_R ~ N(-dF + beta sigma^2 / 2, sigma)
+    W_F = rng.normal(dF + 0.5 * sigma ** 2 / kT, sigma, 4000)
+    W_R = rng.normal(-dF + 0.5 * sigma ** 2 / kT, sigma, 3000)
+    barMachine = BAR.BARestimator(W_F, W_R, T)
+    DF = barMachine.BARSC(float(W_F.mean()))
+
+    # 4 batches, so that several workers get some
+    batch_bytes = 8 * 4 * (W_F.size + W_R.size) * 30
+    runs = [bootstrap.bootstrapDF(W_F, W_R, T, DF, 120, seed = 7, workers = workers, batch_bytes = batch_bytes)
+            for workers in (1, 2, None)]
+    assert all(np.array_equal(runs[0], run) for run in runs[1:])
+    assert not np.array_equal(runs[0], bootstrap.bootstrapDF(W_F, W_R, T, DF, 120, seed = 8, batch_bytes = batch_bytes))
+    print('bootstrap: same replicates with 1, 2 and all workers')
+
+    # the first replicates again, solved one by one
+    seed = np.random.SeedSequence(7).spawn(4)[0]
+    sample = np.random.default_rng(seed)
+    X_F = W_F[sample.integers(0, W_F.size, size = (30, W_F.size))]
+    X_R = W_R[sample.integers(0, W_R.size, size = (30, W_R.size))]
+    for i in range(5):
+        ref = BAR.BARestimator(X_F[i], X_R[i], T).BARSC(DF)
+        assert abs(runs[0][i] - ref) < 1e-7, (i, runs[0][i], ref)
+    print('bootstrap: replicates equal BARSC on the same resampled data')
+
+    error = float(np.std(bootstrap.bootstrapDF(W_F, W_R, T, DF, 400, seed = 3), ddof = 1))
+    asymptotic = math.sqrt(barMachine.variance)
+    assert abs(error / asymptotic - 1) < 0.2, (error, asymptotic)
+    print('bootstrap error %.4f, asymptotic BAR error %.4f' % (error, asymptotic))
+
+    series = []
+    for phi in (0.0, 0.5, 0.9):
+        series.append(ar1(phi, 200000, rng))
+        g = autocorr.statisticalInefficiency(series[-1])
+        exact = (1 + phi) / (1 - phi)
+        assert abs(g / exact - 1) < 0.15, (phi, g, exact)
+        print('AR(1) phi = %.1f: statistical inefficiency %.2f, exact %.2f' % (phi, g, exact))
+    batched = autocorr.batchInefficiency(series + [series[1][:5000]], fft_bytes = 1 << 20)
+    single = [autocorr.statisticalInefficiency(x) for x in series + [series[1][:5000]]]
+    assert np.allclose(batched, single, rtol = 1e-12)
+    indices = autocorr.subsampleIndices(1000, 19.0)
+    assert indices[0] == 0 and np.all(np.diff(indices) >= 18) and np.all(np.diff(indices) <= 20)
@@ -0,0 +1,69 @@
+'''
+Check the parse cache (fepCache) and the window index (fepIndex) against a plain parse of the same file:
+windows loaded from the cache and lazily decoded windows carry the same work, and an in-place edit that keeps
+the size and the modification time of the file invalidates both the cache entry and the index sidecar.
+'''
+import os
+import sys
+import tempfile
+import numpy as np
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+import fepReader
+import fepCache
+import fepIndex
+from fepInterpretor import fepWin
+from fepGenerator import writePair
+
+def sameRecords(recs, parsed):
+    assert len(recs) == len(parsed), (len(recs), len(parsed))
+    for (rec, ref) in zip(recs, parsed):
+        assert (rec.lambda1, rec.lambda2, rec.F_read) == (ref.lambda1, ref.lambda2, ref.F_read)
+        assert np.array_equal(rec.W, ref.W)
+
+def editInPlace(filename):
+    '''
+    Rewrite the F_read of the first window with as many characters, and restore the modification time.
+    Return the new F_read.
+    '''
+    st = os.stat(filename)
+    with open(filename, 'rb') as infile:
+        data = infile.read()
+    k = data.index(fepReader.FREE_MARK)
+    e = data.index(b'\n', k)
+    old = data[k:e].split()[11]
+    new = b'9' * len(old)
+    with open(filename, 'wb') as outfile:
+        outfile.write(data[:k] + data[k:e].replace(old, new, 1) + data[e:])
+    os.utime(filename, ns = (st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(filename).st_size == st.st_size
+    return float(new)
+
+with tempfile.TemporaryDirectory() as tmp:
+    (fwd, bwd, truth) = writePair(os.path.join(tmp, 'leg'), 5, 2000)
+    cache_dir = os.path.join(tmp, 'cache')
+    parsed = list(fepReader.readWindows(fwd))
+
+    stored = fepCache.loadWindows(fwd, cache_dir = cache_dir) # parsed, then stored
+    cached = fepCache.loadWindows(fwd, cache_dir = cache_dir) # memory-mapped from the entry
+    sameRecords(stored, parsed)
+    sameRecords(cached, parsed)
+    assert all(isinstance(rec.W, np.memmap) for rec in cached)
+    print('cache: stored and cached windows equal the parsed ones')
+
+    eager = list(fepWin.bulkYield(fwd, 300))
+    for fresh in (True, False): # the index built, then read from its sidecar
+        lazy = fepIndex.lazyWindows(fwd, 300, cache = fepIndex.winCache(), cache_dir = cache_dir)
+        assert len(lazy) == len(eager)
+        for (win, ref) in zip(lazy, eager):
+            assert (win.lambda1, win.lambda2, win.F_read, win.NSamples) == (ref.lambda1, ref.lambda2, ref.F_read, len(ref.W_list))
+            assert np.array_equal(win.W_list, ref.W_list)
+            assert (win.meanW, win.var) == (ref.meanW, ref.var)
+    print('index: lazy windows equal the eager ones')
+
+    F_read = editInPlace(fwd)
+    assert fepCache.loadWindows(fwd, cache_dir = cache_dir)[0].F_read == F_read
+    assert fepIndex.loadIndex(fwd, cache_dir = cache_dir)[0][5] == F_read
+    assert fepIndex.lazyWindows(fwd, 300, cache_dir = cache_dir)[0].F_read == F_read
+    print('same size and mtime, new content: cache entry and index rebuilt')
@@ -0,0 +1,54 @@
+'''
+Check the one-pass estimators (estimators) and the convergence tables (convergence) against direct evaluations:
+every estimate of multiEstimate equals its textbook formula and BARSC on the same data, all of them recover the
+known dF of Gaussian work obeying Crooks, and every row of convergenceProfile equals BARSC solved from scratch
+on the same prefix or suffix of the data.
+'''
+import os
+import sys
+import math
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import BAR
+import estimators
+import convergence
+
+if __name__ == '__main__':
+    T = 300
+    kT = BAR.k_B * T
+    beta = 1.0 / kT
+    (dF, sigma) = (2.0, 0.6)
+    rng = np.random.default_rng(5)
+    # several blocks of estimators.BLOCK samples, the last one partial
+    W_F = rng.normal(dF + 0.5 * beta * sigma ** 2, sigma, 150000)
+    W_R = rng.normal(-dF + 0.5 * beta * sigma ** 2, sigma, 100000)
+
+    result = estimators.multiEstimate(W_F, W_R, T)
+    barMachine = BAR.BARestimator(W_F, W_R, T)
+    direct = {'EXP_F': -kT * math.log(np.mean(np.exp(-beta * W_F))),
+              'EXP_R': kT * math.log(np.mean(np.exp(-beta * W_R))),
+              'GAUSS_F': W_F.mean() - 0.5 * beta * W_F.var(ddof = 1),
+              'GAUSS_R': -(W_R.mean() - 0.5 * beta * W_R.var(ddof = 1)),
+              'MEAN_W': 0.5 * (W_F.mean() - W_R.mean()),
+              'BAR': barMachine.BARSC(float(W_F.mean()))}
+    direct['BAR_error'] = math.sqrt(barMachine.variance)
+    for name in estimators.ESTIMATORS:
+        assert abs(result[name] - direct[name]) < 1e-9, (name, result[name], direct[name])
+        if name != 'BAR_error':
+            assert abs(result[name] - dF) < 0.02, (name, result[name], dF)
+    assert result['passes'] == barMachine.niter
+    assert estimators.crossCheck(result, result['EXP_F'], -result['EXP_R']) == []
+    assert estimators.crossCheck(result, result['EXP_F'] + 0.1, None) == ['read_fwd']
+    print('estimators: all equal their direct formulas and recover dF = %.1f' % dF)
+
+    (table, passes) = convergence.convergenceProfile(W_F, W_R, T, 10)
+    assert len(table) == 10 and passes < 3 * len(table)
+    for (fraction, DF_fwd, err_fwd, DF_rev, err_rev) in table:
+        n_F = int(round(fraction * W_F.size))
+        n_R = int(round(fraction * W_R.size))
+        for (DF, err, X_F, X_R) in ((DF_fwd, err_fwd, W_F[:n_F], W_R[:n_R]), (DF_rev, err_rev, W_F[W_F.size - n_F:], W_R[W_R.size - n_R:])):
+            ref = BAR.BARestimator(X_F, X_R, T)
+            assert abs(DF - ref.BARSC(float(X_F.mean()))) < 1e-8, (fraction, DF)
+            assert abs(err - math.sqrt(ref.variance)) < 1e-8 * err, (fraction, err)
+    assert table[-1][1] == table[-1][3]
+    print('convergence: every prefix and suffix equals BARSC from scratch, %.1f data passes' % passes)
@@ -0,0 +1,71 @@
+'''
+Check the tail-following reader (fepMonitor): a file appended to in pieces cut in the middle of lines is read
+into the same windows as a plain parse, a follower restored from a checkpoint taken in the middle of a window
+carries on as if it had never stopped, later checkpoints do not rewrite the windows already saved, and the live
+BAR profile ends equal to fepAnalysis.analyze on the finished files.
+'''
+import os
+import sys
+import tempfile
+import numpy as np
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+import fepReader
+import fepMonitor
+import fepAnalysis
+from fepGenerator import writePair
+
+def sameWindows(wins, parsed):
+    assert len(wins) == len(parsed), (len(wins), len(parsed))
+    for (rec, ref) in zip(wins, parsed):
+        assert (rec.lambda1, rec.lambda2, rec.F_read, rec.start, rec.end) == (ref.lambda1, ref.lambda2, ref.F_read, ref.start, ref.end)
+        assert np.array_equal(rec.W, ref.W)
+        for name in ref.columns:
+            assert np.array_equal(rec.columns[name], ref.columns[name])
+
+with tempfile.TemporaryDirectory() as tmp:
+    (fwd, bwd, truth) = writePair(os.path.join(tmp, 'leg'), 6, 1500)
+    with open(fwd, 'rb') as infile:
+        data = infile.read()
+    parsed = list(fepReader.readWindows(fwd, columns = ('dG',)))
+    growing = os.path.join(tmp, 'growing.fepout')
+    checkpoint = os.path.join(tmp, 'growing.ck.npz')
+    cuts = [int(data.index(b'FepEnergy:', parsed[1].start) + 37), len(data) // 2 + 11, int(parsed[4].start) + 5, len(data)]
+    assert all(data[c - 1:c] != b'\n' for c in cuts[:-1]) # all but the last cut in the middle of a line
+
+    follower = fepMonitor.fepFollower(growing, ('dG',))
+    restored = None
+    inodes = None
+    for (i, cut) in enumerate(cuts):
+        with open(growing, 'wb') as outfile:
+            outfile.write(data[:cut])
+        follower.poll(chunk_size = 4096)
+        if restored is not None:
+            restored.poll()
+        current = follower.current()
+        done = [rec for rec in parsed if rec.end <= follower.offset]
+        sameWindows(follower.windows, done)
+        if current is not None: # the samples of the window being written, read so far
+            ref = parsed[len(done)]
+            assert np.array_equal(current.W, ref.W[:current.W.size]) and current.W.size < ref.W.size
+        if i == 1:
+            follower.checkpoint(checkpoint)
+            restored = fepMonitor.fepFollower.fromCheckpoint(checkpoint)
+            inodes = {name: os.stat(os.path.join(checkpoint + '.windows', name)).st_ino for name in os.listdir(checkpoint + '.windows')}
+        if i == 2:
+            follower.checkpoint(checkpoint)
+            for (name, inode) in inodes.items():
+                assert os.stat(os.path.join(checkpoint + '.windows', name)).st_ino == inode, name
+    sameWindows(follower.windows, parsed)
+    sameWindows(restored.windows, parsed)
+    assert follower.current() is None and restored.offset == follower.offset == len(data)
+    print('follower: same windows as a plain parse, also when restored from a checkpoint')
+    print('checkpoint: %d window files saved once and kept' % len(inodes))
+
+    live = fepMonitor.liveBAR(growing, bwd, 300)
+    profile = live.update()
+    ref = fepAnalysis.analyze(fwd, bwd, 300)
+    assert [row[:2] for row in profile] == [row[:2] for row in ref.windows]
+    assert all(row[4] for row in profile) and abs(profile[-1][3] - ref.F) < 1e-12
+    print('live BAR: final profile equals analyze, F = %.4f' % ref.F)
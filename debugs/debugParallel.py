@@ -0,0 +1,46 @@
+'''
+Check that fepParallel.parallelDF gives bitwise the same DF and error_F as the serial winPair.calcDF,
+on the full data and after subsample().
+'''
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import fepParallel
+from fepInterpretor import fepWin, winPair
+
+def pairs(nwin = 6, nsamp = 5000, seed = 0):
+    rng = np.random.default_rng(seed)
+    result = []
+    for i in range(nwin):
+        (l1, l2) = (i / nwin, (i + 1) / nwin)
+        # correlated work (AR(1)), so that subsampling keeps only part of the samples
+        W = [np.empty(nsamp), np.empty(nsamp)]
+        for (k, mean) in enumerate((1.2, -0.8)):
+            noise = rng.normal(0, 0.6, nsamp)
+            W[k][0] = noise[0]
+            for t in range(1, nsamp):
+                W[k][t] = 0.9 * W[k][t - 1] + noise[t]
+            W[k] += mean
+        win_f = fepWin()
+        win_f.set(l1, l2, W[0])
+        win_b = fepWin()
+        win_b.set(l2, l1, W[1])
+        for win in (win_f, win_b):
+            win.set_temperature(300)
+        result.append(winPair(win_f, win_b))
+    return result
+
+if __name__ == '__main__':
+    for subsample in (False, True):
+        serial = pairs()
+        parallel = pairs()
+        for (p, q) in zip(serial, parallel):
+            if subsample:
+                p.subsample()
+                q.subsample()
+            p.calcDF()
+        fepParallel.parallelDF(parallel, workers = 2)
+        same = all((p.DF, p.error_F) == (q.DF, q.error_F) for (p, q) in zip(serial, parallel))
+        print('subsampled' if subsample else 'full data', 'identical:', same)
+        assert same
@@ -0,0 +1,122 @@
+'''
+Check the bulk reader (fepReader.readWindows) against the line reader (fepWin.winYield) on small fepout files:
+several chunk sizes (down to 1 byte and one line), CRLF line ends, wrapped and short FepEnergy lines that force
+the loadtxt fallback, a '#NEW' line starting exactly at a chunk boundary, and IDWS output, whose FepE_back lines
+have the layout of FepEnergy lines but must not be read as work. The summary mode (fepSummary) is checked against
+the statistics of the parsed work, read in chunks small enough to split the windows into many blocks.
+'''
+import os
+import sys
+import tempfile
+import math
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import fepReader
+import BAR
+import Histogram
+import fepSummary
+from fepInterpretor import fepWin
+
+LINE = 'FepEnergy: %6d %14.4f %14.4f %14.4f %14.4f %14.4f %14.4f %14.4f %14.4f\n'
+
+def fepout(nwin = 4, nsamp = 30, seed = 0, idws = False):
+    rng = np.random.default_rng(seed)
+    text = ['#            STEP                 Elec                            vdW                    dE           dE_avg         Temperature             dG\n']
+    lambdas = np.linspace(0, 1, nwin + 1)
+    for (l1, l2) in zip(lambdas[:-1], lambdas[1:]):
+        text.append('#NEW FEP WINDOW: LAMBDA SET TO %g LAMBDA2 %g\n' % (l1, l2))
+        text.append('#STARTING COLLECTION OF ENSEMBLE AVERAGE\n')
+        for i in range(nsamp):
+            fields = ((i + 1) * 10,) + tuple(rng.normal(0, 30, 8))
+            text.append(LINE % fields)
+            if idws: # the backward energy of the same step, same layout
+                text.append('FepE_back:' + (LINE % (fields[:5] + (-fields[5],) + fields[6:]))[len('FepEnergy:'):])
+        text.append('\n#Free energy change for lambda window [ %g %g ] is %.4f ; net change until now is 0.0\n' % (l1, l2, rng.normal()))
+    return ''.join(text)
+
+def lineReader(filename, columns):
+    '''
+    The reference: winYield for the work, a plain line split for the extra columns.
+    '''
+    wins = list(fepWin.winYield(filename, 300))
+    extra = []
+    current = None
+    with open(filename, newline = None) as infile:
+        for line in infile:
+            if line.startswith('#NEW'):
+                current = [[] for name in columns]
+                extra.append(current)
+            elif line.startswith('FepEnergy:'):
+                fields = line.split()
+                for (values, name) in zip(current, columns):
+                    values.append(float(fields[fepReader.COLUMNS.index(name) + 1]))
+    return wins, extra
+
+def check(name, text, chunk_sizes, columns = ('step', 'elec_l', 'dG')):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'test.fepout')
+        with open(filename, 'wb') as outfile:
+            outfile.write(text.encode())
+        (wins, extra) = lineReader(filename, columns)
+        for chunk_size in chunk_sizes:
+            recs = list(fepReader.readWindows(filename, chunk_size, columns))
+            assert len(recs) == len(wins), (name, chunk_size, len(recs), len(wins))
+            for (rec, win, cols) in zip(recs, wins, extra):
+                assert (rec.lambda1, rec.lambda2, rec.F_read) == (win.lambda1, win.lambda2, win.F_read), (name, chunk_size)
+                assert np.array_equal(rec.W, win.W_list), (name, chunk_size)
+                for (column, values) in zip(columns, cols):
+                    assert np.array_equal(rec.columns[column], values), (name, chunk_size, column)
+    print('%-24s OK, chunk sizes %s' % (name, chunk_sizes))
+
+text = fepout()
+line = len(LINE % ((0,) + (0.0,) * 8))
+boundary = text.index('#NEW', text.index('#NEW') + 1) # a chunk ends right before the second '#NEW'
+sizes = [1, 7, line, line + 1, boundary, 4096, fepReader.CHUNK_SIZE]
+check('LF', text, sizes)
+check('CRLF', text.replace('\n', '\r\n'), [1, line, line + 2, boundary + text[:boundary].count('\n'), 4096])
+lines = text.split('\n')
+k = lines.index(next(l for l in lines if l.startswith('FepEnergy:')))
+first = lines[k].split()
+lines[k] = ' '.join(first[:7]) + '\n' + ' '.join(first[7:]) # wrapped: the tail on a line of its own
+lines[k + 5] = ' '.join(lines[k + 5].split()[:7]) # short: the last fields missing
+check('wrapped and short lines', '\n'.join(lines), [1, line, boundary, 4096], columns = ('step', 'elec_l'))
+check('no trailing newline', text.rstrip('\n'), [1, line, 4096])
+# IDWS: a FepE_back line after every FepEnergy line, with the same layout
+idws = fepout(idws = True)
+assert idws.count('FepE_back:') == idws.count('FepEnergy:') == 120
+check('IDWS', idws, [1, line, boundary, 4096, fepReader.CHUNK_SIZE])
+with tempfile.TemporaryDirectory() as tmp:
+    filename = os.path.join(tmp, 'idws.fepout')
+    with open(filename, 'w') as outfile:
+        outfile.write(idws)
+    counted = [rec.NSamples for rec in fepReader.readWindows(filename, count_only = True)]
+    assert counted == [rec.W.size for rec in fepReader.readWindows(filename)] == [30] * 4, counted
+print('IDWS sample counts OK')
+
+# the clean block takes the fixed-width path, the damaged ones the loadtxt fallback
+block = ''.join(l + '\n' for l in text.split('\n') if l.startswith('FepEnergy:')).encode()
+assert fepReader._fixedWidth(block, (6,)) is not None
+assert fepReader._fixedWidth(block.replace(b'\n', b'\r\n'), (6,)) is None
+assert fepReader._fixedWidth(''.join(l + '\n' for l in lines[k:k + 8]).encode(), (6,)) is None
+print('fixed-width path and fallback taken as expected')
+
+# summary mode: the running statistics equal those of the whole window
+with tempfile.TemporaryDirectory() as tmp:
+    filename = os.path.join(tmp, 'test.fepout')
+    with open(filename, 'w') as outfile:
+        outfile.write(fepout(nsamp = 400))
+    (lo, hi) = (-60.0, 60.0)
+    kT = BAR.k_B * 300
+    recs = list(fepReader.readWindows(filename))
+    for chunk_size in (line, 4096, fepReader.CHUNK_SIZE):
+        summaries = [r.summary for r in fepReader.readWindows(filename, chunk_size, summary = fepSummary.factory(300, lo, hi, 40), keep_raw = False)]
+        assert len(summaries) == len(recs)
+        for (s, rec) in zip(summaries, recs):
+            W = rec.W
+            assert s.n == W.size and (s.min, s.max) == (W.min(), W.max())
+            assert abs(s.mean - W.mean()) < 1e-12 and abs(s.variance() - W.var(ddof = 1)) < 1e-9
+            assert abs(s.EXP() + kT * math.log(np.mean(np.exp(-W / kT)))) < 1e-9
+            assert np.array_equal(s.counts, Histogram.histCounts(W, lo, hi, 40))
+            assert (s.under, s.over) == (int((W < lo).sum()), int((W > hi).sum()))
+    assert [w.summary.n for w in fepWin.summaryYield(filename, 300, lo, hi, 40)] == [rec.W.size for rec in recs]
+print('summary mode: moments, EXP and histogram equal those of the parsed work')
@@ -0,0 +1,58 @@
+'''
+Check the restraint TI module (Contribution_restraints/restraintTI.py): the Simpson rule integrates quadratic
+gradients exactly on unevenly spaced lambda values, in both directions, the trapezoid rule linear ones; the
+records of a NAMD log read in small chunks are split back into the restraints they came from; and the profile is
+shifted to lambda = 0 and reversed as shift.py does.
+'''
+import os
+import sys
+import tempfile
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'Contribution_restraints'))
+import restraintTI
+
+def A(l): # integral of the gradient 3 l^2 - 2 l + 0.5
+    return l ** 3 - l ** 2 + 0.5 * l
+
+def grad(l):
+    return 3 * l ** 2 - 2 * l + 0.5
+
+if __name__ == '__main__':
+    lambdas = np.array([0.0, 0.05, 0.15, 0.3, 0.5, 0.55, 0.8, 1.0])
+    for l in (lambdas, lambdas[::-1]):
+        integral = restraintTI.integrate(l, grad(l), 'simpson')
+        assert np.allclose(integral, A(l) - A(l[0]), rtol = 0, atol = 1e-13), integral - (A(l) - A(l[0]))
+        linear = restraintTI.integrate(l, 2 * l - 1, 'trapezoid')
+        assert np.allclose(linear, (l ** 2 - l) - (l[0] ** 2 - l[0]), rtol = 0, atol = 1e-13)
+    assert np.allclose(restraintTI.integrate(lambdas[:2], grad(lambdas[:2]), 'simpson'),
+                       restraintTI.integrate(lambdas[:2], grad(lambdas[:2]), 'trapezoid'))
+    print('integrate: Simpson exact on a quadratic, trapezoid on a linear gradient, uneven lambdas, both directions')
+
+    # rectangle rule of deltaA_restr_individual.tcl: each interval takes the gradient at its end other than lambda = 0
+    g = grad(lambdas)
+    expected = np.concatenate([[0.0], np.cumsum(g[1:] * np.diff(lambdas))])
+    assert np.allclose(restraintTI.integrate(lambdas, g, 'rectangle'), expected)
+
+    # a log running lambda from 1 to 0 with two restraints, interleaved with other lines
+    run = lambdas[::-1]
+    lines = []
+    for l in run:
+        lines.append('ENERGY:  %d  0.0 1.0 2.0\n' % int(1000 * l))
+        for (k, scale) in enumerate((1.0, -2.0)):
+            lines.append('colvars: Lambda= %.4f dA/dLambda= %.10f restraint%d\n' % (l, scale * grad(l), k + 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'run.log')
+        with open(log, 'w') as outfile:
+            outfile.writelines(lines)
+        (l, gr) = restraintTI.readGradients(log, chunk_size = 64)
+        assert l.size == 2 * run.size
+        restraints = restraintTI.splitRestraints(l, gr)
+        assert len(restraints) == 2
+        for ((rl, rg), scale) in zip(restraints, (1.0, -2.0)):
+            assert np.array_equal(rl, run) and np.allclose(rg, scale * grad(run), atol = 1e-9)
+        profiles = restraintTI.restraintProfiles(log, 'simpson')
+    for ((pl, pA, pdA), scale) in zip(profiles, (1.0, -2.0)):
+        assert np.array_equal(pl, lambdas) # reversed to increasing lambda
+        assert np.allclose(pA, scale * A(lambdas), atol = 1e-8) and pA[0] == 0.0
+        assert np.allclose(pdA[1:], np.diff(pA)) and pdA[0] == 0.0
+    print('readGradients, splitRestraints, shiftA: two restraints recovered and shifted to lambda = 0')
@@ -0,0 +1,37 @@
+'''
+Check the out-of-core mode (fepSpill): windows spilled to memory-mapped files while the file is parsed carry
+the same work and extra columns as windows parsed in memory, for several chunk sizes, stay valid after the
+spill directory is cleaned up, and leave no spill file behind.
+'''
+import os
+import sys
+import tempfile
+import numpy as np
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+import fepReader
+import fepSpill
+from fepInterpretor import fepWin
+from fepGenerator import writePair
+
+COLUMNS = ('elec_l', 'vdw_ldl')
+
+with tempfile.TemporaryDirectory() as tmp:
+    (fwd, bwd, truth) = writePair(os.path.join(tmp, 'leg'), 4, 3000)
+    parsed = list(fepReader.readWindows(fwd, columns = COLUMNS))
+    for chunk_size in (4096, fepReader.CHUNK_SIZE): # windows over many blocks, and one block
+        with fepSpill.spillDir(tmp) as spiller:
+            spilled = list(fepReader.readWindows(fwd, chunk_size, COLUMNS, spill = spiller))
+            wins = list(fepWin.bulkYield(fwd, 300, chunk_size, spill = spiller))
+            path = spiller.path
+        assert not os.path.exists(path)
+        assert len(spilled) == len(wins) == len(parsed)
+        for (rec, win, ref) in zip(spilled, wins, parsed):
+            assert isinstance(rec.W, np.memmap) and not rec.W.flags.writeable
+            assert (rec.lambda1, rec.lambda2, rec.F_read) == (ref.lambda1, ref.lambda2, ref.F_read)
+            assert np.array_equal(rec.W, ref.W) and np.array_equal(win.W_list, ref.W)
+            for name in COLUMNS:
+                assert np.array_equal(rec.columns[name], ref.columns[name])
+        print('chunk size %d: spilled windows equal the parsed ones, spill directory removed' % chunk_size)
+    assert [name for name in os.listdir(tmp) if name.startswith('fepspill-')] == []
@@ -5,21 +5,104 @@ __Email__ = '''
             '''
 
 import math
-def _logmean(exp_args):
+import numpy as np
+import fepLog
+
+k_B = 0.001987200 # Boltzmann constant, in unit kcal/(mol K)
+
+def _logmean(exp_args, buff = None):
     '''
-    exp_args: a list of values
+    exp_args: an array of values (float64)
+    buff: a scratch array of the same length, overwritten. If not given, exp_args itself is overwritten.
     _logmean(exp_arg) = log(mean(1/(1+exp(exp_args))))
+    -----------
+    log(1/(1+exp(x))) = -softplus(x) = -logaddexp(0, x), and the mean is taken as a log-sum-exp,
+    so that no exp() is ever evaluated on a large positive argument.
     '''
     '''
-    # Old version of codes
-    S = 0
-    for arg in exp_args:
-        S += 1 / (1 + math.exp(arg))
-    return math.log(S / len(exp_args))
-    '''
+    # Old version of codes, raises OverflowError for arguments above ~709
     S = sum([1/(1 + math.exp(f)) for f in exp_args])
     return math.log(S / len(exp_args))
+    '''
+    if buff is None:
+        buff = exp_args
+    np.logaddexp(0.0, exp_args, out = buff)
+    np.negative(buff, out = buff)
+    m = buff.max()
+    buff -= m
+    np.exp(buff, out = buff)
+    return m + math.log(buff.sum() / buff.size)
     
+def EXPestimate(W, Temperature):
+    '''
+    Exponential averaging (Zwanzig) estimate of the free-energy change from one work array:
+    DeltaF = -kT * log(mean(exp(-W/kT))), evaluated as a log-sum-exp.
+    For reverse work, -EXPestimate(W_R, T) estimates the forward free-energy change.
+    '''
+    kT = k_B * Temperature
+    x = np.multiply(W, -1.0 / kT, dtype = np.float64)
+    m = x.max()
+    x -= m
+    np.exp(x, out = x)
+    return -kT * float(m + math.log(x.sum() / x.size))
+
+def _fermiSums(W, shift, beta, buff, buff2, squares = True):
+    '''
+    One fused evaluation of the Fermi-function sums of a work array, used by the Newton solver.
+    W: work array (float64); shift: -DeltaF for forward work, +DeltaF for reverse work.
+    buff, buff2: scratch arrays of the same shape as W, overwritten.
+    W may also be a 2D array holding one work sample per row (e.g. bootstrap replicates), with shift
+    a column of one DeltaF per row; the sums are then taken along each row.
+    -----------
+    With x = beta * (W + shift) and f = 1/(1+exp(x)), returns (m, s0, s1, s2) such that
+    sum(f) = exp(m) * s0, sum(f * (1 - f)) = exp(m) * s1 and sum(f**2) = exp(2m) * s2.
+    squares: if False, s2 (only needed for the variance) is not computed and is returned as None.
+    The sums are evaluated in log space: log(f) = -softplus(x), log(1 - f) = x + log(f).
+    '''
+    np.add(W, shift, out = buff2)
+    buff2 *= beta                                # x
+    np.logaddexp(0.0, buff2, out = buff)
+    np.negative(buff, out = buff)                # log(f)
+    m = buff.max(axis = -1, keepdims = True)
+    buff2 += buff
+    buff2 += buff                                # log(f) + log(1 - f)
+    buff2 -= m
+    np.exp(buff2, out = buff2)
+    buff -= m
+    np.exp(buff, out = buff)
+    s2 = np.einsum('...i,...i->...', buff, buff) if squares else None
+    return m[..., 0], buff.sum(axis = -1), buff2.sum(axis = -1), s2
+
+def _mergeSums(parts):
+    '''
+    Combine sums taken over several parts of one work array into the sums of the whole array.
+    Each part is (m, s0, s1, s2) as returned by _fermiSums, or a shorter tuple of the same kind, e.g. the
+    (max, rescaled sum) of a log-sum-exp: s0 and s1 are relative to exp(m), s2 to exp(2m).
+    '''
+    M = max(p[0] for p in parts)
+    merged = [M]
+    for k in range(1, len(parts[0])):
+        power = 2 if k == 3 else 1
+        merged.append(math.fsum(p[k] * math.exp(power * (p[0] - M)) for p in parts))
+    return tuple(merged)
+
+def _barTerms(sums_F, N_F, sums_R, N_R, kT):
+    '''
+    BARzero, its derivative and Bennett's asymptotic variance (see BARestimator.BARderiv) from the _fermiSums
+    of the forward and backward work, N_F and N_R samples. The sums may also be arrays, one entry per replicate;
+    the variance is None if the sums of f**2 were not taken.
+    '''
+    (mF, s0F, s1F, s2F) = sums_F
+    (mR, s0R, s1R, s2R) = sums_R
+    log = np.log if np.ndim(s0F) else math.log
+    logF = mF + log(s0F / N_F)
+    logR = mR + log(s0R / N_R)
+    if s2F is None or s2R is None:
+        variance = None
+    else: # <f^2>/<f>^2/N = s2/s0^2, the exp(m) factors cancel
+        variance = kT * kT * max(s2F / s0F**2 - 1.0 / N_F + s2R / s0R**2 - 1.0 / N_R, 0.0)
+    return kT * (logR - logF), -(s1F / s0F + s1R / s0R), variance
+
 class BARestimator:
     '''
     The BARestimator class for BAR analysis.
@@ -34,15 +117,24 @@ class BARestimator:
         Rvs: Reverse work
         Temperature: As the name says.
         '''
-        self.W_F = Fwd
-        self.W_R = Rvs
+        # Each work list is kept as one contiguous float64 array (no copy if it already is one),
+        # and the scratch buffers for BARzero are allocated once here.
+        self.W_F = np.ascontiguousarray(Fwd, dtype = np.float64)
+        self.W_R = np.ascontiguousarray(Rvs, dtype = np.float64)
         self.Temp = Temperature
+        self._buff_F = np.empty_like(self.W_F)
+        self._buff_R = np.empty_like(self.W_R)
+        self._buff2_F = np.empty_like(self.W_F)
+        self._buff2_R = np.empty_like(self.W_R)
+        self.niter = 0 # number of passes over the data in the last BARSC run
+        self.residual = None # the last value of BARzero in the last BARSC run
+        self.stop = None # why the last BARSC run stopped: 'converged', 'precision' or 'maxiter'
+        self.variance = None # asymptotic variance of the DeltaF of the last BARSC run, (kcal/mol)^2
         if len(self.W_F) == 0 or len(self.W_R) == 0:
-            print("This is an EMPTY BARestimator!!!")
+            fepLog.warning("This is an EMPTY BARestimator!!!")
             self.isempty = True
         else:
-            info = "Read in forward work list of length {0}, reverse work list of length {1}".format(len(self.W_F), len(self.W_R))
-            print(info)
+            fepLog.info("Read in forward work list of length %d, reverse work list of length %d", len(self.W_F), len(self.W_R))
             self.isempty = False
     
     def readFromFile(self, FwdName, RvsName, Temperature):
@@ -59,16 +151,15 @@ class BARestimator:
         Parameter DeltaF is an initial guess or input value. 
         The DeltaF value from FEP output should be taken as the initial guess. If not specified, 0 will be taken as input. 
         '''
-        k = 0.001987200 # Boltzmann constant
-        kT = k * self.Temp #In unit kcal/mol
-        exp_args_F = []
-        exp_args_R = []
-        for wf in self.W_F:
-            exp_args_F.append(wf - DeltaF)
-        for wr in self.W_R:
-            exp_args_R.append(wr + DeltaF)
-        logF = _logmean(exp_args_F)
-        logR = _logmean(exp_args_R)
+        kT = k_B * self.Temp #In unit kcal/mol
+        beta = 1.0 / kT
+        # exp_args_F = beta * (W_F - DeltaF), exp_args_R = beta * (W_R + DeltaF), computed in place
+        np.subtract(self.W_F, DeltaF, out = self._buff_F)
+        self._buff_F *= beta
+        np.add(self.W_R, DeltaF, out = self._buff_R)
+        self._buff_R *= beta
+        logF = _logmean(self._buff_F)
+        logR = _logmean(self._buff_R)
         '''
         Test use:
         print("logF = %8.4f" % logF)
@@ -77,22 +168,91 @@ class BARestimator:
         return kT * (logR - logF)
         
     
-    def BARSC(self, DeltaF = 0, convergence = 1e-8, MAXITER = 1000): #self-consistent estimation
+    def BARderiv(self, DeltaF = 0):
+        '''
+        Same as BARzero, but also returns the derivative of BARzero with respect to DeltaF.
+        Both come from one fused pass over each work array.
+        d(BARzero)/d(DeltaF) = -(<f(1-f)>_F / <f>_F + <f(1-f)>_R / <f>_R), which lies in (-2, 0),
+        so BARzero is monotonically decreasing and has exactly one root.
+        The same pass gives Bennett's asymptotic variance of DeltaF, valid at the root:
+        var(DeltaF) = kT^2 * ((<f^2>_F / <f>_F^2 - 1) / N_F + (<f^2>_R / <f>_R^2 - 1) / N_R),
+        kept in self._variance for BARSC.
+        '''
+        kT = k_B * self.Temp
+        beta = 1.0 / kT
+        sums_F = _fermiSums(self.W_F, -DeltaF, beta, self._buff_F, self._buff2_F)
+        sums_R = _fermiSums(self.W_R, DeltaF, beta, self._buff_R, self._buff2_R)
+        token, slope, self._variance = _barTerms(sums_F, self.W_F.size, sums_R, self.W_R.size, kT)
+        return token, slope
+    
+    def BARSC(self, DeltaF = 0, convergence = 1e-8, MAXITER = 1000, method = 'newton'): #self-consistent estimation
         '''
         BARzero < convergence is satisfied when achieving convergence.
         Maximum number of BAR estimations is MAXITER, if convergence is not reached. 
         Input parameter DeltaF is an initial guess.
+        method: 'newton' (default) solves BARzero = 0 by Newton's method on BARderiv, safeguarded by bisection
+                once the root is bracketed; 'fixed' is the plain fixed-point update DeltaF = DeltaF + BARzero.
+        After the run, self.niter holds the number of iterations, self.residual the final BARzero value,
+        self.variance the asymptotic variance of the estimate (see BARderiv) and self.stop why the run stopped:
+        'converged', 'precision' (the Newton bracket of the root cannot shrink any further in floating point,
+        so DeltaF is as close to the root as it can be, even though BARzero is not below convergence) or 'maxiter'.
         '''
+        with fepLog.stage('bar', N_F = self.W_F.size, N_R = self.W_R.size, method = method) as event:
+            if method == 'newton':
+                DeltaF = self._BARnewton(DeltaF, convergence, MAXITER)
+            elif method == 'fixed':
+                DeltaF = self._BARfixed(DeltaF, convergence, MAXITER)
+                self.BARderiv(DeltaF) # one more pass, for the variance
+            else:
+                raise ValueError('Unknown method for BARSC: %s' % method)
+            self.variance = self._variance
+            event.update(iterations = self.niter, residual = self.residual, DF = DeltaF, stop = self.stop)
+        if self.stop == 'converged':
+            fepLog.info("Convergence achieved, after %d iterations!", self.niter)
+        elif self.stop == 'precision':
+            fepLog.info("Converged to floating-point precision after %d iterations, BARzero is %.3g.", self.niter, self.residual)
+        else:
+            fepLog.warning("Maximum number of iteration reached! BARzero is still %.3g.", self.residual)
+        fepLog.info('Estimated Free energy change is: %7.4f', DeltaF)
+        return DeltaF
+    
+    def _BARfixed(self, DeltaF, convergence, MAXITER):
+        self.stop = 'maxiter'
         for iteration in range(MAXITER):
             token = self.BARzero(DeltaF)
             if math.fabs(token) < convergence:
+                self.stop = 'converged'
                 break
             else:
                 DeltaF = DeltaF + token
-        if iteration < MAXITER:
-            print("Convergence achieved, after %d iterations!" % (iteration + 1))
-        else:
-            print("Maximum number of iteration reached!")
-        print('Estimated Free energy change is: %7.4f' % DeltaF)
+        self.niter = iteration + 1
+        self.residual = token
+        return DeltaF
+    
+    def _BARnewton(self, DeltaF, convergence, MAXITER):
+        lo = None # largest DeltaF known to give BARzero > 0
+        hi = None # smallest DeltaF known to give BARzero < 0
+        self.stop = 'maxiter'
+        for iteration in range(MAXITER):
+            token, slope = self.BARderiv(DeltaF)
+            if math.fabs(token) < convergence:
+                self.stop = 'converged'
+                break
+            if token > 0:
+                lo = DeltaF
+            else:
+                hi = DeltaF
+            if slope < 0:
+                step = DeltaF - token / slope
+            else: # the derivative underflowed, fall back to a fixed-point step
+                step = DeltaF + token
+            if lo is not None and hi is not None:
+                if not lo < step < hi:
+                    step = 0.5 * (lo + hi)
+                if hi - lo < 1e-15 * max(1.0, math.fabs(DeltaF)): # bracket cannot shrink any further
+                    self.stop = 'precision'
+                    break
+            DeltaF = step
+        self.niter = iteration + 1
+        self.residual = token
         return DeltaF
-        
\ No newline at end of file
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Free-energy contributions of the individual restraints, by thermodynamic integration of dA/dLambda.
+-------------------------------------
+Replaces deltaA_restr_individual.tcl and shift.py, without the grep pre-pass and in one pipeline:
+1. The NAMD log is read once, in large binary chunks. The 'dA/dLambda' lines are picked out by a regular
+   expression and their lambda (field 2) and dA/dLambda (field 4) are converted chunk by chunk with numpy.
+2. The records are split per restraint as in the Tcl script: at every lambda the restraints report one after
+   the other, so a record with the same lambda as the one before belongs to the next restraint, and a new
+   lambda starts again from the first restraint.
+3. Each restraint is integrated over lambda, in the order the lambda values were run:
+       'trapezoid'  (default) trapezoidal rule
+       'simpson'    piecewise quadratic (Simpson) rule, also for unevenly spaced lambda values
+       'rectangle'  the rule of the Tcl script: each interval takes the gradient at its end that is not lambda = 0
+4. As shiftA of shift.py does, the profile is taken relative to lambda = 0 and written from lambda = 0 onwards
+   (reversed if lambda was run from 1 to 0); dA is then the change over the interval ending at that lambda.
+
+Usage:
+    python restraintTI.py run.log output [--method trapezoid|simpson|rectangle] [--no-shift]
+writes output.restraint.1.dat, output.restraint.2.dat, ... with the columns lambda, A, dA.
+'''
+import re
+import argparse
+import numpy as np
+
+CHUNK_SIZE = 1 << 24 # 16 MiB per read
+MARK = b'dA/dLambda'
+
+def readGradients(filename, mark = MARK, lambda_field = 2, grad_field = 4, chunk_size = CHUNK_SIZE):
+    '''
+    Read the lambda values and dA/dLambda of all the records of a NAMD log, in file order.
+    Return two float64 arrays (lambdas, gradients).
+    '''
+    pattern = re.compile(rb'^[^\n]*' + re.escape(mark) + rb'[^\n]*$', re.M)
+    lambdas = []
+    grads = []
+    carry = b''
+    with open(filename, 'rb') as infile:
+        while True:
+            chunk = infile.read(chunk_size)
+            buff = carry + chunk
+            last = len(buff) if not chunk else buff.rfind(b'\n') + 1
+            carry = buff[last:]
+            lines = pattern.findall(buff, 0, last)
+            if lines:
+                data = np.loadtxt(lines, usecols = (lambda_field, grad_field), ndmin = 2)
+                lambdas.append(data[:, 0])
+                grads.append(data[:, 1])
+            if not chunk:
+                break
+    if not lambdas:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(lambdas), np.concatenate(grads)
+
+def splitRestraints(lambdas, grads):
+    '''
+    Split the records into one (lambdas, gradients) pair of arrays per restraint.
+    '''
+    n = lambdas.size
+    if n == 0:
+        return []
+    new = np.ones(n, dtype = bool)
+    new[1:] = lambdas[1:] != lambdas[:-1] # a new lambda starts again from the first restraint
+    starts = np.flatnonzero(new)
+    index = np.arange(n) - starts[np.cumsum(new) - 1] # restraint of every record
+    return [(lambdas[index == i], grads[index == i]) for i in range(index.max() + 1)]
+
+def _simpsonWeights(h0, h1):
+    '''
+    Weights of f0, f1, f2 in the integral over [x0, x1] of the quadratic through x0, x1 = x0 + h0, x2 = x1 + h1.
+    '''
+    H = h0 + h1
+    return h0 / 2 - h0 * h0 / (6 * H), h0 * (3 * H - 2 * h0) / (6 * h1), -h0 ** 3 / (6 * H * h1)
+
+def integrate(lambdas, grads, method = 'trapezoid'):
+    '''
+    Integral of dA/dLambda from the first lambda to every lambda, in the order given.
+    Return the array of A, starting with 0.
+    '''
+    h = np.diff(lambdas)
+    if method == 'trapezoid' or (method == 'simpson' and lambdas.size < 3):
+        dA = 0.5 * (grads[1:] + grads[:-1]) * h
+    elif method == 'simpson':
+        dA = np.empty(h.size)
+        # every interval but the last: quadratic through its two ends and the next point
+        (w0, w1, w2) = _simpsonWeights(h[:-1], h[1:])
+        dA[:-1] = w0 * grads[:-2] + w1 * grads[1:-1] + w2 * grads[2:]
+        # the last interval: quadratic through its two ends and the point before, integrated backwards
+        (w0, w1, w2) = _simpsonWeights(-h[-1], -h[-2])
+        dA[-1] = -(w0 * grads[-1] + w1 * grads[-2] + w2 * grads[-3])
+    elif method == 'rectangle':
+        # as deltaA_restr_individual.tcl: drop the gradient at lambda = 0 and pair the others with the intervals
+        g = np.delete(grads, np.flatnonzero(lambdas == 0)[:1])
+        dA = g[:h.size] * h
+    else:
+        raise ValueError('Unknown integration method: %s' % method)
+    A = np.zeros(lambdas.size)
+    np.cumsum(dA, out = A[1:])
+    return A
+
+def shiftA(lambdas, A):
+    '''
+    The profile relative to lambda = 0, in increasing lambda order, as shiftA of shift.py.
+    Return (lambdas, A, dA), dA being the change of A over the interval ending at each lambda (0 for the first).
+    '''
+    zero = np.flatnonzero(lambdas == 0)
+    if zero.size:
+        A = A - A[zero[0]]
+    else:
+        print('WARNING: No record at lambda = 0, the profile is not shifted.')
+    if lambdas.size > 1 and lambdas[-1] < lambdas[0]:
+        lambdas = lambdas[::-1]
+        A = A[::-1]
+    dA = np.zeros(A.size)
+    dA[1:] = np.diff(A)
+    return lambdas, A, dA
+
+def restraintProfiles(filename, method = 'trapezoid', shift = True):
+    '''
+    The free-energy profile of every restraint of a NAMD log, as a list of (lambdas, A, dA).
+    '''
+    profiles = []
+    for (lambdas, grads) in splitRestraints(*readGradients(filename)):
+        A = integrate(lambdas, grads, method)
+        if shift:
+            profiles.append(shiftA(lambdas, A))
+        else:
+            dA = np.zeros(A.size)
+            dA[1:] = np.diff(A)
+            profiles.append((lambdas, A, dA))
+    return profiles
+
+def writeProfiles(profiles, output):
+    '''
+    Write every profile to output.restraint.<i>.dat, in the format of deltaA_restr_individual.tcl.
+    '''
+    for (i, (lambdas, A, dA)) in enumerate(profiles, 1):
+        filename = '%s.restraint.%d.dat' % (output, i)
+        with open(filename, 'w') as outfile:
+            outfile.write('# lambda       A         dA\n')
+            outfile.writelines('%-8g  %9.4f  %9.4f\n' % row for row in zip(lambdas.tolist(), A.tolist(), dA.tolist()))
+        print('File %s written.' % filename)
+    print('Altogether %d files created.' % len(profiles))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Free-energy contributions of the individual restraints from a NAMD log.')
+    parser.add_argument('log')
+    parser.add_argument('output')
+    parser.add_argument('--method', default = 'trapezoid', choices = ('trapezoid', 'simpson', 'rectangle'))
+    parser.add_argument('--no-shift', dest = 'shift', action = 'store_false', help = 'do not shift to lambda = 0 and reverse')
+    args = parser.parse_args()
+    profiles = restraintProfiles(args.log, args.method, args.shift)
+    print('%d restraints recorded.' % len(profiles))
+    for (i, (lambdas, A, dA)) in enumerate(profiles, 1):
+        print('Restraint %d: DeltaA = %.4f from lambda %g to %g' % (i, A[-1] - A[0], lambdas[0], lambdas[-1]))
+    writeProfiles(profiles, args.output)
@@ -4,6 +4,57 @@ __Email__ = '''
                 maoyuncheng@mail.nankai.edu.cn
             '''
             
+import numpy as np
+import fepLog
+
+BLOCK = 1 << 20 # samples binned per block, bounds the temporary index array
+
+def histCounts(data, lo, hi, Nintervals = 200):
+    '''
+    Count data in Nintervals equal bins spanning [lo, hi], in one O(n) pass and without sorting or copying data.
+    Values equal to hi go to the last bin; values outside [lo, hi] are discarded.
+    Data of any dtype (e.g. float32 work) is binned in float64, one block at a time.
+    Return an integer array of counts.
+    '''
+    data = np.asarray(data)
+    (lo, hi) = (float(lo), float(hi))
+    counts = np.zeros(Nintervals, dtype = np.int64)
+    scale = Nintervals / (hi - lo) if hi > lo else 0.0
+    buff = np.empty(min(BLOCK, data.size))
+    for start in range(0, data.size, BLOCK):
+        block = data[start:start + BLOCK]
+        b = buff[:block.size]
+        np.copyto(b, block) # float64 copy of this block only
+        inside = (b >= lo) & (b <= hi)
+        b -= lo
+        b *= scale
+        index = b[inside].astype(np.intp)
+        np.minimum(index, Nintervals - 1, out = index)
+        counts += np.bincount(index, minlength = Nintervals)
+    return counts
+
+def pairHist(W_f, W_b, Nintervals = 250):
+    '''
+    Histograms of the forward and backward work of a window on one shared grid spanning both.
+    Return (x, P_f, P_b): the bin centres and the two normalized histograms.
+    '''
+    W_f = np.asarray(W_f)
+    W_b = np.asarray(W_b)
+    lo = float(min(W_f.min(), W_b.min()))
+    hi = float(max(W_f.max(), W_b.max()))
+    incr = (hi - lo) / Nintervals
+    x = lo + incr * (0.5 + np.arange(Nintervals))
+    return x, histCounts(W_f, lo, hi, Nintervals) / W_f.size, histCounts(W_b, lo, hi, Nintervals) / W_b.size
+
+def formatHist(x, P):
+    '''
+    Text block of one histogram, in the layout of printhist.
+    '''
+    outBuff = '# Value       Probability\n'
+    outBuff += ''.join(['%-12.4f  %-8.4f\n' % (V, p) for (V, p) in zip(x, P)])
+    outBuff += '#' + '-' * 40 + '\n'
+    return outBuff
+
 class Histogram:
     '''
     data, stores raw data;
@@ -11,57 +62,36 @@ class Histogram:
     '''
     def __init__(self, DataArray): # Read in data
         '''
-        Read data from a list or dictionary
+        Read data from a list, array or dictionary.
+        The data is neither sorted nor copied.
         '''
-        print('-' * 40)
-        if isinstance(DataArray, list):
-            self.data = DataArray # reference, not copy!
         if isinstance(DataArray, dict):
-            self.data = [v for (k,v) in DataArray.items()]
-            del k
-        print('Raw data for histogram analysis read.')
-        print('Sorting data...')
-        self.data.sort()
-        '''
-        Print test:
-        '''
-        #print(self.data)
+            DataArray = [v for (k,v) in DataArray.items()]
+        self.data = np.asarray(DataArray) # reference, not copy, for float arrays of any precision
+        if not np.issubdtype(self.data.dtype, np.floating):
+            self.data = self.data.astype(np.float64)
+        fepLog.info('Raw data for histogram analysis read.')
         self.size = len(self.data)
-        self.min = self.data[0]
-        self.max = self.data[-1]
-        print('Input summary: Max value is %.4f, Min value is %.4f, number of data points is %d.' % (self.max, self.min, self.size))
+        self.min = float(self.data.min())
+        self.max = float(self.data.max())
+        fepLog.info('Input summary: Max value is %.4f, Min value is %.4f, number of data points is %d.', self.max, self.min, self.size)
     
     def stat(self, Nintervals = 200):
         '''
         Calculate histogram.
-        By default, 100 statistical intervals will be applied.
+        By default, 200 statistical intervals will be applied.
         '''
         incr = (self.max - self.min) / Nintervals # increment
-        current = self.min + incr
-        count = [0] * Nintervals # hits in each interval
-        index = 0
-        print('Scanning through sorted data list...')
-        for f in self.data: # scan through the list
-            if f <= current:
-                count[index] += 1
-            elif f < self.max:
-                index += 1
-                count[index] += 1
-                current += incr
-            else: # to prevent the out-of-range error
-                count[Nintervals -1] += 1
+        count = histCounts(self.data, self.min, self.max, Nintervals)
         x = [self.min + incr * (0.5 + i) for i in range(Nintervals)]
         P = [c / self.size for c in count]
         self.hist = dict(zip(x,P))
-        print('Statistics completed.')
+        fepLog.info('Statistics completed.')
         
     def printhist(self, filehandle=None):
-        outBuff = '# Value       Probability\n'
         from operator import itemgetter
-        for (V, P) in sorted(self.hist.items(), key=itemgetter(0)):
-            outBuff += '%-12.4f  %-8.4f\n' % (V, P)
-        outBuff += '#' + '-' * 40 + '\n'
+        outBuff = formatHist(*zip(*sorted(self.hist.items(), key=itemgetter(0))))
         if filehandle == None: # print to stdout
             print(outBuff)
         else:
-            filehandle.write(outBuff) 
\ No newline at end of file
+            filehandle.write(outBuff)
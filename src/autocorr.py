@@ -0,0 +1,104 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Autocorrelation and statistical inefficiency of work time series.
+-------------------------------------
+The autocorrelation function is computed with an FFT (Wiener-Khinchin), O(N log N) instead of O(N^2).
+The statistical inefficiency is g = 1 + 2 * sum_t (1 - t/N) C(t), with the sum cut at the first lag where
+the normalized autocorrelation C(t) drops to zero. Taking every g-th sample then gives (nearly) uncorrelated
+samples, whose indices can be used directly to index the work arrays given to BARestimator or bootstrap.
+Series of equal length are transformed together, as the rows of one 2D FFT.
+'''
+import numpy as np
+
+FFT_BYTES = 1 << 28 # memory for the spectra of one batch of series, 256 MiB
+
+def _fftSize(n):
+    '''
+    Smallest power of 2 not below 2n, so that the circular correlation has no wrap-around.
+    '''
+    return 1 << (2 * n - 1).bit_length()
+
+def autocorrelation(x):
+    '''
+    Normalized autocorrelation function C(t), t = 0 ... N-1, of one series or of the rows of a 2D array.
+    '''
+    x = np.asarray(x, dtype = np.float64)
+    n = x.shape[-1]
+    dx = x - x.mean(axis = -1, keepdims = True)
+    spectrum = np.fft.rfft(dx, n = _fftSize(n), axis = -1)
+    np.multiply(spectrum, spectrum.conj(), out = spectrum)
+    acf = np.fft.irfft(spectrum, axis = -1)[..., :n]
+    acf /= np.arange(n, 0, -1) # unbiased: the lag-t sum has N - t terms
+    c0 = acf[..., :1].copy()
+    c0[c0 == 0] = 1.0 # a constant series is uncorrelated
+    acf /= c0
+    return acf
+
+def _inefficiency(acf):
+    '''
+    Statistical inefficiency from one normalized autocorrelation function.
+    '''
+    n = acf.size
+    negative = np.flatnonzero(acf[1:] <= 0)
+    cut = negative[0] + 1 if negative.size else n
+    t = np.arange(1, cut)
+    return max(1.0, 1.0 + 2.0 * float(np.dot(1.0 - t / n, acf[1:cut])))
+
+def statisticalInefficiency(x):
+    '''
+    Statistical inefficiency g of one series: the number of correlated samples worth one independent sample.
+    '''
+    return _inefficiency(autocorrelation(x))
+
+def batchInefficiency(series, fft_bytes = FFT_BYTES):
+    '''
+    Statistical inefficiencies of many series (e.g. the W_list of all windows), in the given order.
+    Series of equal length are stacked and transformed together, as many at a time as fft_bytes allows.
+    '''
+    g = [None] * len(series)
+    groups = dict()
+    for (i, x) in enumerate(series):
+        groups.setdefault(len(x), []).append(i)
+    for (n, members) in groups.items():
+        if n < 2:
+            for i in members:
+                g[i] = 1.0
+            continue
+        rows = max(1, fft_bytes // (16 * _fftSize(n)))
+        for first in range(0, len(members), rows):
+            batch = members[first:first + rows]
+            acf = autocorrelation(np.stack([np.asarray(series[i], dtype = np.float64) for i in batch]))
+            for (i, row) in zip(batch, acf):
+                g[i] = _inefficiency(row)
+    return g
+
+def subsampleIndices(n, g):
+    '''
+    Indices of nearly uncorrelated samples of a series of length n with statistical inefficiency g.
+    '''
+    indices = np.unique(np.round(np.arange(0, n / g) * g).astype(np.intp))
+    return indices[indices < n]
+
+def decorrelate(x):
+    '''
+    Return (indices, g) of the uncorrelated subsample of one series.
+    '''
+    g = statisticalInefficiency(x)
+    return subsampleIndices(len(x), g), g
+
+def subsamplePairs(pairs):
+    '''
+    Compute, in one batch, the uncorrelated subsample indices of both windows of every winPair in pairs.
+    They are stored as subsample_f and subsample_b of each pair (see winPair.subsample).
+    '''
+    series = [p.fwd_win.W_list for p in pairs] + [p.bwd_win.W_list for p in pairs]
+    g = batchInefficiency(series)
+    n = len(pairs)
+    for (i, p) in enumerate(pairs):
+        p.g_f, p.g_b = g[i], g[n + i]
+        p.subsample_f = subsampleIndices(len(series[i]), g[i])
+        p.subsample_b = subsampleIndices(len(series[n + i]), g[n + i])
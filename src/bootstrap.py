@@ -0,0 +1,130 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Bootstrap error estimation of BAR.
+-------------------------------------
+Bootstrap replicates are drawn in batches, as matrices of resampling indices (one row per replicate),
+and the BAR equations of all the replicates of a batch are solved at once: every Newton iteration is
+one pass over the whole batch, and every replicate starts from the DeltaF of the full data.
+The batches are spread over worker processes. Each batch has its own random stream, spawned from one
+seed, so that the result depends on the seed only, not on the number of workers.
+'''
+import os
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import BAR
+import fepLog
+from fepParallel import lambdaOrder
+
+BATCH_BYTES = 1 << 28 # memory for the arrays of one batch, 256 MiB
+
+_data = None # (W_F, W_R, Temperature) of the window, set once per worker process
+
+def _setData(W_F, W_R, Temperature):
+    global _data
+    _data = (W_F, W_R, Temperature)
+
+def solveReplicates(X_F, X_R, Temperature, DeltaF, convergence = 1e-8, MAXITER = 100):
+    '''
+    Solve the BAR equation for every row of X_F and X_R (one replicate per row) by Newton's method,
+    safeguarded by bisection as in BARestimator.BARSC. DeltaF is the initial guess of all rows.
+    As in BARSC, a row is done when BARzero < convergence, or when its step or its bracket has shrunk to the
+    float resolution of DeltaF; done rows are dropped, so that every iteration only goes through the others.
+    Return the array of DeltaF, one per row.
+    '''
+    kT = BAR.k_B * Temperature
+    beta = 1.0 / kT
+    nrep = X_F.shape[0]
+    buff_F, buff2_F = np.empty_like(X_F), np.empty_like(X_F)
+    buff_R, buff2_R = np.empty_like(X_R), np.empty_like(X_R)
+    result = np.full(nrep, float(DeltaF))
+    rows = np.arange(nrep) # the rows not done yet, in the order of X_F and X_R
+    DF = result.copy()
+    lo = np.full(nrep, -np.inf)
+    hi = np.full(nrep, np.inf)
+    for iteration in range(MAXITER):
+        n = rows.size
+        # the variance of each replicate is not needed, so neither is the sum of f**2
+        sums_F = BAR._fermiSums(X_F, -DF[:, None], beta, buff_F[:n], buff2_F[:n], False)
+        sums_R = BAR._fermiSums(X_R, DF[:, None], beta, buff_R[:n], buff2_R[:n], False)
+        token, slope = BAR._barTerms(sums_F, X_F.shape[1], sums_R, X_R.shape[1], kT)[:2]
+        lo = np.where(token > 0, DF, lo)
+        hi = np.where(token > 0, hi, DF)
+        safe = slope < 0
+        step = np.where(safe, DF - token / np.where(safe, slope, -1.0), DF + token)
+        outside = np.isfinite(lo) & np.isfinite(hi) & ~((step > lo) & (step < hi))
+        step = np.where(outside, 0.5 * (lo + hi), step)
+        resolution = 1e-15 * np.maximum(1.0, np.abs(DF))
+        stalled = (np.abs(step - DF) < resolution) | (hi - lo < resolution) # cannot get any closer
+        done = (np.abs(token) < convergence) | stalled
+        result[rows[done]] = DF[done]
+        if done.all():
+            break
+        DF = step
+        if done.any():
+            keep = ~done
+            (X_F, X_R, DF, lo, hi, rows) = (X_F[keep], X_R[keep], DF[keep], lo[keep], hi[keep], rows[keep])
+    else:
+        result[rows] = DF
+        fepLog.warning('%d bootstrap replicates did not converge.', rows.size)
+    return result
+
+def _batch(job):
+    (seed, nrep, DeltaF, convergence, MAXITER) = job
+    (W_F, W_R, Temperature) = _data
+    rng = np.random.default_rng(seed)
+    X_F = W_F[rng.integers(0, W_F.size, size = (nrep, W_F.size))]
+    X_R = W_R[rng.integers(0, W_R.size, size = (nrep, W_R.size))]
+    return solveReplicates(X_F, X_R, Temperature, DeltaF, convergence, MAXITER)
+
+def bootstrapDF(W_F, W_R, Temperature, DeltaF, nboot = 200, seed = None, workers = 1, batch_bytes = BATCH_BYTES,
+                convergence = 1e-8, MAXITER = 100):
+    '''
+    Return the DeltaF of nboot bootstrap replicates of the window (W_F, W_R).
+    -----------
+    DeltaF: the BAR estimate of the full data, used as the initial guess of every replicate
+    seed: seed of the random streams (an int or a numpy SeedSequence); None for a random one
+    workers: number of worker processes (None for all CPUs)
+    batch_bytes: memory allowed for the arrays of one batch of replicates
+    '''
+    W_F = np.ascontiguousarray(W_F, dtype = np.float64)
+    W_R = np.ascontiguousarray(W_R, dtype = np.float64)
+    per_replicate = 8 * 4 * (W_F.size + W_R.size) # 3 work-sized arrays and the indices, per direction
+    size = max(1, min(nboot, batch_bytes // per_replicate))
+    sizes = [size] * (nboot // size) + ([nboot % size] if nboot % size else [])
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    jobs = [(child, n, DeltaF, convergence, MAXITER) for (child, n) in zip(seed.spawn(len(sizes)), sizes)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        _setData(W_F, W_R, Temperature)
+        results = list(map(_batch, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers = min(workers, len(jobs)), initializer = _setData, initargs = (W_F, W_R, Temperature)) as pool:
+            results = list(pool.map(_batch, jobs))
+    return np.concatenate(results)
+
+def bootstrapError(W_F, W_R, Temperature, DeltaF, nboot = 200, seed = None, workers = 1):
+    '''
+    Bootstrap estimate of the standard error of the BAR free-energy change of one window.
+    '''
+    return float(np.std(bootstrapDF(W_F, W_R, Temperature, DeltaF, nboot, seed, workers), ddof = 1))
+
+def errorProfile(pairs):
+    '''
+    Per-window and cumulative errors of a list of winPair, in lambda order.
+    Windows are independent, so the cumulative variance is the sum of the window variances.
+    Return a list of tuples (lambda_low, lambda_high, error_F, cumulative error).
+    '''
+    profile = []
+    var = 0.0
+    for p in lambdaOrder(pairs):
+        var += p.error_F ** 2
+        l = (p.fwd_win.lambda1, p.fwd_win.lambda2)
+        profile.append((min(l), max(l), p.error_F, math.sqrt(var)))
+    return profile
@@ -0,0 +1,128 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Time-convergence profiles of BAR estimates.
+-------------------------------------
+The free-energy change of a window is estimated on the first (forward in time) and on the last (reverse in time)
+10%, 20%, ... 100% of its samples. Both work arrays are cut into as many segments as there are fractions, so
+that every prefix and every suffix is a run of whole segments, taken as views of the arrays (nothing is copied).
+segmentBAR keeps, for each segment, the Fermi sums of its last evaluation and the DeltaF they were evaluated at;
+the sums of a prefix or suffix are combined from those of its segments, and only the segments whose sums are
+not at the current DeltaF are evaluated again.
+
+The full data is solved first. Each shorter prefix (then suffix) is warm-started from the DeltaF of the one
+before it, so its first Newton iteration costs nothing, all its segments being already evaluated there;
+the next iterations evaluate the prefix. The whole table costs a few full BAR solves; the number of passes
+over the data is returned with it.
+'''
+import math
+import numpy as np
+import BAR
+import fepLog
+from fepParallel import lambdaOrder
+
+class segmentBAR(BAR.BARestimator):
+    '''
+    A BARestimator working on a selection of segments of its work arrays, with the sums of every segment cached.
+    nseg: number of segments of each work array
+    '''
+    def __init__(self, Fwd, Rvs, Temperature, nseg = 10):
+        BAR.BARestimator.__init__(self, Fwd, Rvs, Temperature)
+        nseg = max(1, min(nseg, self.W_F.size, self.W_R.size))
+        self.nseg = nseg
+        self.bounds_F = np.linspace(0, self.W_F.size, nseg + 1).round().astype(np.intp)
+        self.bounds_R = np.linspace(0, self.W_R.size, nseg + 1).round().astype(np.intp)
+        self._cache_F = [None] * nseg # (DeltaF, m, s0, s1, s2) of the last evaluation of each segment
+        self._cache_R = [None] * nseg
+        self.evaluated = 0 # number of samples evaluated so far
+        self.select(range(nseg))
+
+    def select(self, segments):
+        '''
+        Use only the given segments (a list of indices) from now on.
+        '''
+        self.segments = list(segments)
+        self.N_F = sum(int(self.bounds_F[j + 1] - self.bounds_F[j]) for j in self.segments)
+        self.N_R = sum(int(self.bounds_R[j + 1] - self.bounds_R[j]) for j in self.segments)
+
+    def _sums(self, W, bounds, cache, shift, beta, buff, buff2, DeltaF):
+        parts = []
+        for j in self.segments:
+            c = cache[j]
+            if c is None or c[0] != DeltaF:
+                (a, b) = (bounds[j], bounds[j + 1])
+                (m, s0, s1, s2) = BAR._fermiSums(W[a:b], shift, beta, buff[a:b], buff2[a:b])
+                c = cache[j] = (DeltaF, float(m), float(s0), float(s1), float(s2))
+                self.evaluated += b - a
+            parts.append(c)
+        return BAR._mergeSums([c[1:] for c in parts])
+
+    def BARderiv(self, DeltaF = 0):
+        '''
+        BARestimator.BARderiv on the selected segments, from the cached sums where possible.
+        '''
+        kT = BAR.k_B * self.Temp
+        beta = 1.0 / kT
+        sums_F = self._sums(self.W_F, self.bounds_F, self._cache_F, -DeltaF, beta, self._buff_F, self._buff2_F, DeltaF)
+        sums_R = self._sums(self.W_R, self.bounds_R, self._cache_R, DeltaF, beta, self._buff_R, self._buff2_R, DeltaF)
+        token, slope, self._variance = BAR._barTerms(sums_F, self.N_F, sums_R, self.N_R, kT)
+        return token, slope
+
+    def solve(self, DeltaF, convergence = 1e-8, MAXITER = 100):
+        '''
+        Newton solution (as BARSC) on the selected segments, from the initial guess DeltaF.
+        Return (DeltaF, asymptotic error).
+        '''
+        DeltaF = self._BARnewton(DeltaF, convergence, MAXITER)
+        if self.stop == 'maxiter':
+            fepLog.warning('BAR on %d of %d segments did not converge, BARzero is still %.3g.', len(self.segments), self.nseg, self.residual)
+        return DeltaF, math.sqrt(self._variance)
+
+def convergenceProfile(W_F, W_R, Temperature, fractions = 10, DeltaF = None, convergence = 1e-8, MAXITER = 100):
+    '''
+    BAR estimates on growing parts of the data of one window.
+    -----------
+    fractions: number of time fractions (10 gives 10%, 20%, ... 100%)
+    DeltaF: initial guess of the full solve, by default the mean forward work
+    Return (table, passes): table is a list of tuples (fraction, DF_forward, error_forward, DF_reverse, error_reverse),
+    forward meaning the first part of the data and reverse the last part; passes is the number of full passes
+    over both work arrays that the whole table took.
+    '''
+    machine = segmentBAR(W_F, W_R, Temperature, fractions)
+    K = machine.nseg
+    if DeltaF is None:
+        DeltaF = float(machine.W_F.mean())
+    full = machine.solve(DeltaF, convergence, MAXITER)
+    forward = {K: full}
+    reverse = {K: full}
+    for (result, segments) in ((forward, lambda k: range(k)), (reverse, lambda k: range(K - k, K))):
+        DF = full[0]
+        for k in range(K - 1, 0, -1):
+            machine.select(segments(k))
+            result[k] = machine.solve(DF, convergence, MAXITER)
+            DF = result[k][0]
+    table = [(k / K,) + forward[k] + reverse[k] for k in range(1, K + 1)]
+    return table, machine.evaluated / (machine.W_F.size + machine.W_R.size)
+
+def formatConvergence(label, table):
+    '''
+    Text of the convergence table of one window.
+    '''
+    lines = ['# Window [ %s ]: fraction, DF (forward in time), error, DF (reverse in time), error' % label]
+    lines += ['%6.3f %12.6f %10.6f %12.6f %10.6f' % row for row in table]
+    return '\n'.join(lines) + '\n'
+
+def writeConvergence(pairs, filename = 'Convergence.dat', fractions = 10):
+    '''
+    Compute the convergence table of every winPair (those without one yet) and write them to filename, in lambda order.
+    '''
+    pairs = lambdaOrder(pairs)
+    with open(filename, 'w') as outfile:
+        for p in pairs:
+            if p.convergence is None:
+                p.calcConvergence(fractions)
+            outfile.write(formatConvergence(p.label, p.convergence))
+    fepLog.info('File %s written.', filename)
@@ -0,0 +1,163 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Several estimators of the free-energy change of one window, side by side.
+-------------------------------------
+    EXP_F    exponential averaging (Zwanzig) of the forward work
+    EXP_R    exponential averaging of the reverse work, with the sign of the forward change
+    BAR      Bennett acceptance ratio, and its asymptotic error BAR_error
+    GAUSS_F  second-order cumulant of the forward work: <W_F> - beta * var(W_F) / 2
+    GAUSS_R  the same for the reverse work, with the sign of the forward change
+    MEAN_W   mean-work estimate (<W_F> - <W_R>) / 2, exact for Gaussian work of equal variance in both directions
+multiEstimate goes once through each work array, block by block, and gathers in that pass everything the
+one-sided estimators need and the first evaluation of BAR:
+    the log-sum-exp of -beta * W, kept per block as a maximum and a rescaled sum, so that no exp() overflows
+    the sum and sum of squares of W, shifted by its first value against cancellation
+    the Fermi sums of BAR._fermiSums at the initial guess DeltaF
+The log-sum-exp and Fermi sums of the blocks are merged by BAR._mergeSums, as are the segments of convergence.
+Each block is small enough to stay in cache while all of them are taken. BAR is then solved by the safeguarded
+Newton method of BARestimator, whose first iteration uses the sums of that pass instead of reading the data
+again: the one-sided estimators cost nothing beyond the first BAR iteration, and a window takes as many passes
+over its data as BAR alone (returned as 'passes').
+
+crossCheck compares the estimators with each other and the EXP values with the ones NAMD printed in the
+'#Free energy change' lines (F_read), and returns the list of disagreements:
+    'read_fwd', 'read_bwd'  EXP differs from F_read of the forward / backward file by more than read_tol
+    'exp'                   EXP_F and EXP_R differ by more than tol (hysteresis, poor overlap)
+    'gauss'                 MEAN_W and BAR differ by more than tol (strongly non-Gaussian work)
+'''
+import math
+import numpy as np
+import BAR
+import fepLog
+from fepParallel import lambdaOrder
+
+BLOCK = 1 << 16 # samples per block, small enough for the block to stay in cache
+ESTIMATORS = ('EXP_F', 'EXP_R', 'BAR', 'BAR_error', 'GAUSS_F', 'GAUSS_R', 'MEAN_W')
+
+def _pass(W, beta, shift = None, block = BLOCK):
+    '''
+    One pass over a work array. Return (n, lse, mean, var, sums), where lse = log(sum(exp(-beta * W))),
+    var is the sample variance and sums the (m, s0, s1, s2) of BAR._fermiSums(W, shift, beta), None without shift.
+    '''
+    W = np.asarray(W)
+    n = W.size
+    if n == 0:
+        return 0, -math.inf, math.nan, math.nan, None
+    c = float(W[0])
+    buff = np.empty(min(block, n))
+    if shift is not None:
+        (fbuff, fbuff2) = (np.empty_like(buff), np.empty_like(buff))
+    s1 = s2 = 0.0
+    lse_parts = [] # (max, rescaled sum) of the log-sum-exp of every block
+    fermi_parts = []
+    for a in range(0, n, block):
+        x = W[a:a + block]
+        d = buff[:x.size]
+        np.subtract(x, c, out = d)
+        s1 += float(d.sum())
+        s2 += float(np.dot(d, d))
+        d *= -beta
+        m = float(d.max())
+        d -= m
+        np.exp(d, out = d)
+        lse_parts.append((m, float(d.sum())))
+        if shift is not None:
+            fermi_parts.append(tuple(float(v) for v in BAR._fermiSums(x, shift, beta, fbuff[:x.size], fbuff2[:x.size])))
+    (M, S) = BAR._mergeSums(lse_parts)
+    mean = s1 / n
+    var = (s2 - n * mean * mean) / (n - 1) if n > 1 else 0.0
+    sums = BAR._mergeSums(fermi_parts) if shift is not None else None
+    return n, M + math.log(S) - beta * c, c + mean, var, sums
+
+def workMoments(W, beta, block = BLOCK):
+    '''
+    One pass over a work array.
+    Return (n, lse, mean, var), where lse = log(sum(exp(-beta * W))) and var is the sample variance.
+    '''
+    return _pass(W, beta, None, block)[:4]
+
+class _primedBAR(BAR.BARestimator):
+    '''
+    A BARestimator whose first evaluation, at DeltaF, was already done: BARderiv returns it once instead of
+    going through the data.
+    '''
+    def __init__(self, Fwd, Rvs, Temperature, DeltaF, token, slope, variance):
+        BAR.BARestimator.__init__(self, Fwd, Rvs, Temperature)
+        self._primed = (DeltaF, token, slope, variance)
+
+    def BARderiv(self, DeltaF = 0):
+        primed = self._primed
+        self._primed = None
+        if primed is not None and primed[0] == DeltaF:
+            self._variance = primed[3]
+            return primed[1], primed[2]
+        return BAR.BARestimator.BARderiv(self, DeltaF)
+
+def multiEstimate(W_F, W_R, Temperature, DeltaF = None, convergence = 1e-8, MAXITER = 100):
+    '''
+    All the estimators of ESTIMATORS for one window, as a dictionary (in kcal/mol), with the number of passes
+    over the data under 'passes'.
+    DeltaF: initial guess of BAR, by default the mean forward work (which costs one more pass; winPair knows it)
+    '''
+    kT = BAR.k_B * Temperature
+    beta = 1.0 / kT
+    if DeltaF is None:
+        DeltaF = float(np.mean(W_F))
+    (nF, lseF, meanF, varF, sums_F) = _pass(W_F, beta, -DeltaF)
+    (nR, lseR, meanR, varR, sums_R) = _pass(W_R, beta, DeltaF)
+    result = dict()
+    result['EXP_F'] = -kT * (lseF - math.log(nF))
+    result['EXP_R'] = kT * (lseR - math.log(nR))
+    result['GAUSS_F'] = meanF - 0.5 * beta * varF
+    result['GAUSS_R'] = -(meanR - 0.5 * beta * varR)
+    result['MEAN_W'] = 0.5 * (meanF - meanR)
+    # the first BAR evaluation, as BARestimator.BARderiv, from the sums of the same pass
+    barMachine = _primedBAR(W_F, W_R, Temperature, DeltaF, *BAR._barTerms(sums_F, nF, sums_R, nR, kT))
+    result['BAR'] = barMachine.BARSC(DeltaF, convergence, MAXITER)
+    result['BAR_error'] = math.sqrt(barMachine.variance)
+    result['passes'] = barMachine.niter
+    return result
+
+def crossCheck(result, F_read_f = None, F_read_b = None, tol = 0.5, read_tol = 0.01):
+    '''
+    The disagreements (see above) of the estimates of multiEstimate.
+    F_read_f, F_read_b: the free-energy changes printed in the forward and backward files, None to skip the check;
+    F_read_b is the change of the backward window as printed, i.e. the opposite of the forward change.
+    '''
+    flags = []
+    if F_read_f is not None and abs(result['EXP_F'] - F_read_f) > read_tol:
+        flags.append('read_fwd')
+    if F_read_b is not None and abs(result['EXP_R'] + F_read_b) > read_tol:
+        flags.append('read_bwd')
+    if abs(result['EXP_F'] - result['EXP_R']) > tol:
+        flags.append('exp')
+    if abs(result['MEAN_W'] - result['BAR']) > tol:
+        flags.append('gauss')
+    return flags
+
+def formatEstimates(pairs):
+    '''
+    Text table of the estimates of winPairs (calcEstimates called), one window per line.
+    '''
+    lines = ['# %-14s' % 'window' + ''.join(' %10s' % name for name in ESTIMATORS) + '  flags']
+    for p in pairs:
+        l = (p.fwd_win.lambda1, p.fwd_win.lambda2)
+        row = '[ %5.3f %5.3f ]' % (min(l), max(l)) + ''.join(' %10.4f' % p.estimates[name] for name in ESTIMATORS)
+        lines.append(row + '  ' + (','.join(p.estimates['flags']) or '-'))
+    return '\n'.join(lines) + '\n'
+
+def writeEstimates(pairs, filename = 'Estimators.dat', tol = 0.5, read_tol = 0.01):
+    '''
+    Compute the estimates of every winPair (those without them yet) and write them to filename, in lambda order.
+    '''
+    pairs = lambdaOrder(pairs)
+    for p in pairs:
+        if p.estimates is None:
+            p.calcEstimates(tol, read_tol)
+    with open(filename, 'w') as outfile:
+        outfile.write(formatEstimates(pairs))
+    fepLog.info('File %s written.', filename)
@@ -0,0 +1,233 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+End-to-end analysis of one leg.
+-------------------------------------
+analyze() reads the forward and backward fepout files of a leg, pairs their windows and returns the BAR
+free-energy profile. Windows are paired in O(n) through dictionaries keyed by lambdaKey (the lambda values
+quantised to a tolerance), never through formatted labels. Windows found in one file only, windows found
+twice in a file and gaps in the lambda path are reported.
+
+By default the pairs are formed from the window index of both files (see fepIndex: one byte scan, no number
+converted), and the work of a pair is decoded only when the pair is solved, then freed, so that one pair at a
+time is in memory. With lazy=False both files are streamed instead, and every pair is solved and freed as soon
+as both of its windows have been read. With use_cache=True the windows are loaded through the parse cache
+(see fepCache), which several processes and later runs share. With workers other than 1 both files are parsed
+at the same time in a pool of processes (through the parse cache with use_cache=True) and the pairs are solved
+in parallel (see fepParallel), all windows being in memory at once. With spill=True the files are streamed and every
+window is spilled to a memory-mapped file as it is read (see fepSpill), so that the windows waiting for their
+partner take no memory.
+'''
+import math
+from itertools import zip_longest
+import fepLog
+import fepIndex
+import fepCache
+import fepReader
+import fepSpill
+import fepParallel
+from fepInterpretor import fepWin, winPair, lambdaKey, LAMBDA_TOL
+
+class legProfile:
+    '''
+    The result of analyze().
+    -----------
+    windows: list of tuples (lambda_low, lambda_high, DF, error_F, F, error) in lambda order,
+             where F and error are the cumulative free-energy change and its error
+    F, error: total free-energy change of the leg and its error, in kcal/mol
+    missing: list of (lambda_low, lambda_high, direction) of the windows found in one file only
+    duplicates: list of (lambda_low, lambda_high, direction, count) of the windows found count times in one file;
+                only the first one is used
+    gaps: list of (lambda_high, lambda_low) where a paired window does not end where the next one begins
+    pairs: the solved winPair objects, without their raw data, if analyze was called with keep_pairs=True
+    '''
+    def __init__(self):
+        self.windows = []
+        self.F = 0.0
+        self.error = 0.0
+        self.missing = []
+        self.duplicates = []
+        self.gaps = []
+        self.pairs = []
+
+    def complete(self):
+        '''
+        True if every window was paired exactly once and the windows cover the lambda path without gaps.
+        '''
+        return not (self.missing or self.duplicates or self.gaps)
+
+def _lambdas(win):
+    return (min(win.lambda1, win.lambda2), max(win.lambda1, win.lambda2))
+
+def _table(wins, direction, tol, duplicates):
+    '''
+    Dictionary key -> window of a list of windows, keeping the first of duplicated windows.
+    '''
+    table = dict()
+    counts = dict()
+    for win in wins:
+        key = lambdaKey(win.lambda1, win.lambda2, tol)
+        if key in table:
+            counts[key] = counts.get(key, 1) + 1
+        else:
+            table[key] = win
+    for (key, count) in counts.items():
+        duplicates.append(_lambdas(table[key]) + (direction, count))
+    return table
+
+def pairWindows(fwd_wins, bwd_wins, tol = LAMBDA_TOL):
+    '''
+    Match forward and backward windows by their lambda values, in O(n).
+    Return (matched, missing, duplicates): matched is a list of (forward window, backward window) in lambda order,
+    missing and duplicates are as in legProfile.
+    '''
+    duplicates = []
+    fwd = _table(fwd_wins, 'fwd', tol, duplicates)
+    bwd = _table(bwd_wins, 'bwd', tol, duplicates)
+    matched = [(fwd[key], bwd[key]) for key in sorted(fwd.keys() & bwd.keys())]
+    missing = [_lambdas(fwd[key]) + ('fwd',) for key in fwd.keys() - bwd.keys()]
+    missing += [_lambdas(bwd[key]) + ('bwd',) for key in bwd.keys() - fwd.keys()]
+    return matched, sorted(missing), duplicates
+
+def _record(pair, solved, keep_pairs, tol):
+    pair.clear_raw_data()
+    win_f = pair.fwd_win
+    solved[lambdaKey(win_f.lambda1, win_f.lambda2, tol)] = (_lambdas(win_f), pair.DF, pair.error_F, pair if keep_pairs else None)
+
+def _solve(win_f, win_b, solved, keep_pairs, tol):
+    pair = winPair(win_f, win_b)
+    pair.calcDF()
+    _record(pair, solved, keep_pairs, tol)
+
+def _solveAll(matched, solved, keep_pairs, tol, workers):
+    '''
+    Solve the matched pairs, one after the other or in a pool of workers processes (None: all CPUs).
+    '''
+    if workers == 1 or len(matched) <= 1:
+        for (win_f, win_b) in matched:
+            _solve(win_f, win_b, solved, keep_pairs, tol)
+        return
+    pairs = [winPair(win_f, win_b) for (win_f, win_b) in matched]
+    fepParallel.parallelDF(pairs, workers if workers is None else min(workers, len(pairs)))
+    for pair in pairs:
+        _record(pair, solved, keep_pairs, tol)
+
+def _streamPairs(fwd_path, bwd_path, Temperature, maxWin, tol, solved, keep_pairs, spill = None):
+    '''
+    Read both files side by side and solve every pair as soon as both of its windows are read.
+    Return (missing, duplicates).
+    '''
+    pending = (dict(), dict())
+    seen = (dict(), dict())
+    duplicates = []
+    streams = (fepWin.bulkYield(fwd_path, Temperature, maxWin, spill = spill), fepWin.bulkYield(bwd_path, Temperature, maxWin, spill = spill))
+    for wins in zip_longest(*streams):
+        for (side, win) in enumerate(wins):
+            if win is None:
+                continue
+            key = lambdaKey(win.lambda1, win.lambda2, tol)
+            if key in seen[side]:
+                seen[side][key][0] += 1
+                continue
+            seen[side][key] = [1, _lambdas(win)]
+            other = pending[1 - side].pop(key, None)
+            if other is None:
+                pending[side][key] = win
+            elif side == 0:
+                _solve(win, other, solved, keep_pairs, tol)
+            else:
+                _solve(other, win, solved, keep_pairs, tol)
+    for (side, direction) in enumerate(('fwd', 'bwd')):
+        for (count, lambdas) in seen[side].values():
+            if count > 1:
+                duplicates.append(lambdas + (direction, count))
+    missing = [_lambdas(win) + (direction,) for (side, direction) in enumerate(('fwd', 'bwd')) for win in pending[side].values()]
+    return sorted(missing), duplicates
+
+def analyze(fwd_path, bwd_path, Temperature, maxWin = 100, tol = LAMBDA_TOL, lazy = True, keep_pairs = False,
+            use_cache = False, cache_dir = None, spill = False, spill_dir = None, workers = 1):
+    '''
+    BAR free-energy profile of one leg.
+    -----------
+    fwd_path, bwd_path: the forward and backward fepout files
+    Temperature: in K
+    tol: lambda values closer than tol are the same (see lambdaKey)
+    lazy: pair the windows from the file indexes and decode one pair at a time (True),
+          or stream both files and solve the pairs as they complete (False).
+          Compressed files are always streamed: reading one window of them means decompressing all before it.
+    keep_pairs: keep the winPair objects (without raw data) in the result
+    use_cache: load the windows through the parse cache (memory-mapped work arrays) instead of either of the above
+    cache_dir: the parse cache directory (see fepCache.cacheDir), also where the window indexes of lazy are kept
+    spill: stream both files, spilling every window to a temporary memory-mapped file in spill_dir
+           (by default the system temporary directory), removed when the analysis is done
+    workers: number of worker processes (None: all CPUs). Other than 1, both files are parsed at the same time
+             (see fepReader.readFiles, or fepCache.loadFiles with use_cache) and the pairs solved in parallel
+             (see fepParallel.parallelDF), instead of lazy or streamed reading. Ignored with spill (without use_cache).
+    Return a legProfile.
+    '''
+    solved = dict()
+    with fepLog.stage('analyze', fwd = fwd_path, bwd = bwd_path, workers = workers) as event:
+        if use_cache or (workers != 1 and not spill):
+            if use_cache:
+                records = fepCache.loadFiles([fwd_path, bwd_path], cache_dir = cache_dir, workers = workers)
+            else:
+                records = fepReader.readFiles([fwd_path, bwd_path], workers)
+            matched, missing, duplicates = pairWindows(*[[fepWin.fromRecord(rec, Temperature, maxWin) for rec in recs] for recs in records], tol)
+            _solveAll(matched, solved, keep_pairs, tol, workers)
+        elif spill:
+            with fepSpill.spillDir(spill_dir) as spiller:
+                missing, duplicates = _streamPairs(fwd_path, bwd_path, Temperature, maxWin, tol, solved, keep_pairs, spiller)
+        elif lazy and fepReader.compression(fwd_path) is None and fepReader.compression(bwd_path) is None:
+            cache = fepIndex.winCache()
+            matched, missing, duplicates = pairWindows(fepIndex.lazyWindows(fwd_path, Temperature, maxWin, cache, cache_dir),
+                                                       fepIndex.lazyWindows(bwd_path, Temperature, maxWin, cache, cache_dir), tol)
+            for (win_f, win_b) in matched:
+                _solve(win_f, win_b, solved, keep_pairs, tol)
+        else:
+            missing, duplicates = _streamPairs(fwd_path, bwd_path, Temperature, maxWin, tol, solved, keep_pairs)
+        event['windows'] = len(solved)
+    return _profile(solved, missing, duplicates)
+
+def profileFromPairs(pairs, missing = (), duplicates = (), tol = LAMBDA_TOL, keep_pairs = False):
+    '''
+    legProfile of winPairs already solved (by calcDF or fepParallel.parallelDF), with the missing and duplicated
+    windows found when pairing them (see pairWindows).
+    '''
+    solved = dict()
+    for pair in pairs:
+        key = lambdaKey(pair.fwd_win.lambda1, pair.fwd_win.lambda2, tol)
+        solved[key] = (_lambdas(pair.fwd_win), pair.DF, pair.error_F, pair if keep_pairs else None)
+    return _profile(solved, list(missing), list(duplicates))
+
+def _profile(solved, missing, duplicates):
+    '''
+    Build the legProfile from the solved windows, key -> ((lambda_low, lambda_high), DF, error_F, pair or None),
+    and report the missing and duplicated windows and the gaps.
+    '''
+    profile = legProfile()
+    profile.missing = missing
+    profile.duplicates = duplicates
+    var = 0.0
+    previous = None
+    for key in sorted(solved):
+        ((lo, hi), DF, error_F, pair) = solved[key]
+        if previous is not None and previous[1] != key[0]:
+            profile.gaps.append((previous_hi, lo))
+        profile.F += DF
+        var += error_F ** 2
+        profile.windows.append((lo, hi, DF, error_F, profile.F, math.sqrt(var)))
+        if pair is not None:
+            profile.pairs.append(pair)
+        previous, previous_hi = key, hi
+    profile.error = math.sqrt(var)
+    for (lo, hi, direction) in profile.missing:
+        fepLog.warning('Window [ %g, %g ] is only found in the %s file, it is left out.', lo, hi, direction)
+    for (lo, hi, direction, count) in profile.duplicates:
+        fepLog.warning('Window [ %g, %g ] is found %d times in the %s file, only the first one is used.', lo, hi, count, direction)
+    for (hi, lo) in profile.gaps:
+        fepLog.warning('Gap in the lambda path between %g and %g.', hi, lo)
+    fepLog.info('Free energy change of the leg: %.4f +- %.4f kcal/mol, from %d windows.', profile.F, profile.error, len(profile.windows))
+    return profile
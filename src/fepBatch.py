@@ -0,0 +1,207 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Batch analysis of many legs, replicas and thermodynamic cycles.
+-------------------------------------
+A manifest (JSON) lists the legs, each with its replicas (pairs of forward and backward fepout files), and the
+cycles, each a signed combination of legs:
+    {
+        "temperature": 300,
+        "legs": {
+            "ligA_bound":   [{"fwd": "ligA/bound/r1/forward.fepout", "bwd": "ligA/bound/r1/backward.fepout"},
+                             {"fwd": "ligA/bound/r2/forward.fepout", "bwd": "ligA/bound/r2/backward.fepout"}],
+            "ligA_unbound": [{"fwd": "ligA/free/r1/forward.fepout", "bwd": "ligA/free/r1/backward.fepout", "temperature": 300}]
+        },
+        "cycles": {"ligA": {"ligA_bound": 1, "ligA_unbound": -1}}
+    }
+Relative paths are taken from the directory of the manifest. A replica may override the temperature.
+
+The legs are run one after the other, and the work of a leg is split by window, not by replica, so that every
+core is used however few replicas there are:
+    parse   the files of all the replicas of the leg are loaded through the parse cache (see fepCache), shared
+            with later runs; the files not cached yet are cut at window boundaries and parsed by all the workers
+            together (fepReader.readFiles)
+    BAR     the window pairs of all the replicas of the leg are solved together by fepParallel.parallelDF
+Only one leg is in memory at a time. A replica whose files cannot be read or paired is reported and left out.
+The results are then aggregated:
+    replica   DeltaG of the leg from one pair of files, and its BAR error (fepAnalysis.analyze)
+    leg       mean of the replicas; spread is their standard deviation, error the standard error of the mean
+              (the propagated BAR error of the mean if there is a single replica)
+    cycle     DDeltaG = sum of coefficient * leg DeltaG, its error from the leg errors
+'''
+import os
+from sys import exit
+import json
+import math
+import fepLog
+import fepCache
+import fepParallel
+import fepAnalysis
+from fepInterpretor import fepWin, winPair
+
+class batchResult:
+    '''
+    Results of a batch run.
+    -----------
+    replicas: leg -> list of dictionaries, one per replica: fwd, bwd, F, error, windows, complete, failed
+    legs: leg -> dictionary: F, spread, error, replicas (number of successful replicas)
+    cycles: cycle -> dictionary: DDG, error, legs (the coefficients)
+    '''
+    def __init__(self):
+        self.replicas = dict()
+        self.legs = dict()
+        self.cycles = dict()
+
+    def writeJSON(self, filename):
+        with open(filename, 'w') as outfile:
+            json.dump({'replicas': self.replicas, 'legs': self.legs, 'cycles': self.cycles}, outfile, indent = 1)
+        fepLog.info('File %s written.', filename)
+
+    def report(self):
+        '''
+        The results as a text table.
+        '''
+        lines = ['%-24s %4s %10s %8s %8s' % ('leg', 'n', 'DeltaG', 'spread', 'error')]
+        for (leg, r) in self.legs.items():
+            lines.append('%-24s %4d %10.4f %8.4f %8.4f' % (leg, r['replicas'], r['F'], r['spread'], r['error']))
+        if self.cycles:
+            lines.append('%-24s %4s %10s %8s' % ('cycle', '', 'DDeltaG', 'error'))
+            for (cycle, r) in self.cycles.items():
+                lines.append('%-24s %4s %10.4f %8.4f' % (cycle, '', r['DDG'], r['error']))
+        return '\n'.join(lines)
+
+def readManifest(filename):
+    '''
+    Load a manifest and make its paths absolute. Return (temperature, legs, cycles).
+    Raise ValueError if a cycle uses a leg that is not in the manifest.
+    '''
+    with open(filename) as infile:
+        manifest = json.load(infile)
+    root = os.path.dirname(os.path.abspath(filename))
+    temperature = manifest.get('temperature', 300.0)
+    legs = dict()
+    for (leg, replicas) in manifest['legs'].items():
+        legs[leg] = [dict(r, fwd = os.path.join(root, r['fwd']), bwd = os.path.join(root, r['bwd'])) for r in replicas]
+    cycles = manifest.get('cycles', dict())
+    for (cycle, terms) in cycles.items():
+        for leg in terms:
+            if leg not in legs:
+                raise ValueError('Cycle %s uses the unknown leg %s.' % (cycle, leg))
+    return temperature, legs, cycles
+
+def _failed(r, err):
+    return {'fwd': r['fwd'], 'bwd': r['bwd'], 'failed': '%s: %s' % (type(err).__name__, err)}
+
+def _loadLeg(replicas, workers, cache_dir):
+    '''
+    The window records of the (fwd, bwd) files of every replica, or the exception that stopped them from loading.
+    All the files are loaded together; if that fails, each replica is loaded alone to find the faulty ones.
+    '''
+    files = [path for r in replicas for path in (r['fwd'], r['bwd'])]
+    try:
+        records = fepCache.loadFiles(files, cache_dir = cache_dir, workers = workers)
+        return [(records[2 * i], records[2 * i + 1]) for i in range(len(replicas))]
+    except (OSError, ValueError, IndexError):
+        pass
+    loaded = []
+    for r in replicas:
+        try:
+            loaded.append(tuple(fepCache.loadFiles([r['fwd'], r['bwd']], cache_dir = cache_dir, workers = workers)))
+        except (OSError, ValueError, IndexError) as err:
+            loaded.append(err)
+    return loaded
+
+def _runLeg(replicas, temperature, workers, cache_dir):
+    '''
+    Solve every window of every replica of one leg. Return the list of replica dictionaries (see batchResult).
+    '''
+    results = [None] * len(replicas)
+    jobs = [] # (replica index, pairs, missing, duplicates)
+    for (i, (r, loaded)) in enumerate(zip(replicas, _loadLeg(replicas, workers, cache_dir))):
+        if isinstance(loaded, Exception):
+            results[i] = _failed(r, loaded)
+            continue
+        try:
+            T = r.get('temperature', temperature)
+            wins = [[fepWin.fromRecord(rec, T) for rec in recs] for recs in loaded]
+            matched, missing, duplicates = fepAnalysis.pairWindows(*wins)
+            jobs.append((i, [winPair(win_f, win_b) for (win_f, win_b) in matched], missing, duplicates))
+        except (ValueError, IndexError) as err:
+            results[i] = _failed(r, err)
+    pairs = [p for job in jobs for p in job[1]]
+    if workers == 1 or len(pairs) <= 1:
+        for p in pairs:
+            p.calcDF()
+    elif pairs:
+        fepParallel.parallelDF(pairs, min(workers, len(pairs)))
+    for (i, leg_pairs, missing, duplicates) in jobs:
+        profile = fepAnalysis.profileFromPairs(leg_pairs, missing, duplicates)
+        for p in leg_pairs:
+            p.clear_raw_data()
+        results[i] = {'fwd': replicas[i]['fwd'], 'bwd': replicas[i]['bwd'], 'F': profile.F, 'error': profile.error,
+                      'windows': len(profile.windows), 'complete': profile.complete(), 'failed': None}
+    return results
+
+def _aggregate(replicas):
+    done = [r for r in replicas if not r['failed']]
+    n = len(done)
+    if n == 0:
+        return {'F': float('nan'), 'spread': float('nan'), 'error': float('nan'), 'replicas': 0}
+    F = math.fsum(r['F'] for r in done) / n
+    if n > 1:
+        spread = math.sqrt(math.fsum((r['F'] - F) ** 2 for r in done) / (n - 1))
+        error = spread / math.sqrt(n)
+    else:
+        spread = 0.0
+        error = done[0]['error']
+    return {'F': F, 'spread': spread, 'error': error, 'replicas': n}
+
+def runBatch(manifest, workers = None, cache_dir = None):
+    '''
+    Analyse every replica of every leg of a manifest (a file name, or the tuple returned by readManifest),
+    leg by leg, with the parsing and the BAR solves of each leg spread over workers processes (None for all CPUs),
+    and aggregate the legs and cycles.
+    Return a batchResult.
+    '''
+    if isinstance(manifest, str):
+        manifest = readManifest(manifest)
+    (temperature, legs, cycles) = manifest
+    if workers is None:
+        workers = os.cpu_count() or 1
+    result = batchResult()
+    with fepLog.stage('batch', legs = len(legs), replicas = sum(len(r) for r in legs.values()), workers = workers):
+        for (leg, replicas) in legs.items():
+            with fepLog.stage('batch_leg', leg = leg, replicas = len(replicas)):
+                result.replicas[leg] = _runLeg(replicas, temperature, workers, cache_dir)
+    for (leg, replicas) in result.replicas.items():
+        for r in replicas:
+            if r['failed']:
+                fepLog.warning('Replica %s / %s of leg %s failed: %s', r['fwd'], r['bwd'], leg, r['failed'])
+            elif not r['complete']:
+                fepLog.warning('Replica %s / %s of leg %s has missing, duplicated or non-contiguous windows.', r['fwd'], r['bwd'], leg)
+        result.legs[leg] = _aggregate(replicas)
+    for (cycle, terms) in cycles.items():
+        DDG = math.fsum(c * result.legs[leg]['F'] for (leg, c) in terms.items())
+        error = math.sqrt(math.fsum((c * result.legs[leg]['error']) ** 2 for (leg, c) in terms.items()))
+        result.cycles[cycle] = {'DDG': DDG, 'error': error, 'legs': dict(terms)}
+    return result
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Analyse the legs, replicas and cycles of a manifest.')
+    parser.add_argument('manifest')
+    parser.add_argument('--workers', type = int, default = None, help = 'worker processes, default all CPUs')
+    parser.add_argument('--cache-dir', default = None, help = 'parse cache directory, see fepCache')
+    parser.add_argument('--output', default = None, help = 'write the results to this JSON file')
+    args = parser.parse_args()
+    try:
+        result = runBatch(args.manifest, args.workers, args.cache_dir)
+    except (OSError, ValueError, KeyError) as err:
+        fepLog.error('%s Exit.', err)
+        exit(1)
+    print(result.report())
+    if args.output:
+        result.writeJSON(args.output)
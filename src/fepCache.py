@@ -0,0 +1,185 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+On-disk cache of parsed fepout files.
+-------------------------------------
+The windows of each fepout file are stored in a cache entry (a directory) holding
+    meta.json      the fingerprint of the source file and the columns stored
+    windows.npy    one row per window: lambda1, lambda2, F_read, start, stop
+    dE.npy         the work of all windows, concatenated; window i is dE[start:stop]
+    <column>.npy   any extra FepEnergy column read, laid out like dE.npy
+The .npy files are loaded with memory mapping, so that loading a cached file costs milliseconds
+and the work arrays of the windows are views into the mapped files.
+
+An entry is valid as long as the path, size, modification time and content hash of the source file
+are unchanged; otherwise it is rebuilt on the next load. The content hash is taken over the whole file, streamed
+in 16 MiB blocks (about 1 GB/s, faster than parsing). With sampled_hash = True only sampled 1 MiB blocks are
+hashed (the head, the tail and one block every 256 MiB): checking a large file then costs almost nothing, but an
+in-place edit that keeps the size and falls between the sampled blocks (a re-run writing a file of the same
+length within the same mtime tick, or a tool restoring the mtime) goes unnoticed and the stale windows are loaded.
+Set use_cache = False, or the environment variable FEPPARSER_NO_CACHE, to bypass the cache.
+The cache directory is $FEPPARSER_CACHE, or ~/.cache/FEPParser by default.
+'''
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import fepReader
+import fepLog
+
+HASH_BLOCK = 1 << 20
+HASH_STRIDE = 1 << 28
+FORMAT_VERSION = 1
+
+def cacheDir(cache_dir = None):
+    if cache_dir is None:
+        cache_dir = os.environ.get('FEPPARSER_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'FEPParser'))
+    return cache_dir
+
+def fingerprint(filename, sampled_hash = False):
+    '''
+    Identify the current content of a file by path, size, modification time and a content hash,
+    of the whole file, or of sampled blocks only if sampled_hash is True (see above).
+    '''
+    path = os.path.abspath(filename)
+    st = os.stat(path)
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as infile:
+        if sampled_hash:
+            offsets = list(range(0, max(st.st_size - HASH_BLOCK, 0), HASH_STRIDE)) + [max(st.st_size - HASH_BLOCK, 0)]
+            for offset in offsets:
+                infile.seek(offset)
+                digest.update(infile.read(HASH_BLOCK))
+        else:
+            buff = memoryview(bytearray(fepReader.CHUNK_SIZE))
+            n = infile.readinto(buff)
+            while n:
+                digest.update(buff[:n])
+                n = infile.readinto(buff)
+    return {'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': digest.hexdigest(),
+            'hash_mode': 'sampled' if sampled_hash else 'full', 'version': FORMAT_VERSION}
+
+def _unchanged(filename, meta):
+    '''
+    True if the size and modification time of a file are still those of its fingerprint meta.
+    '''
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime_ns) == (meta['size'], meta['mtime_ns'])
+
+def entryPath(filename, cache_dir = None):
+    path = os.path.abspath(filename)
+    key = hashlib.sha1(path.encode()).hexdigest()[:16]
+    return os.path.join(cacheDir(cache_dir), '%s-%s' % (key, os.path.basename(path)))
+
+def _load(entry, columns):
+    '''
+    Load a cache entry as a list of winRecord. Return None if the entry lacks any of the columns.
+    '''
+    with open(os.path.join(entry, 'meta.json')) as infile:
+        meta = json.load(infile)
+    if not set(columns) <= set(meta['columns']):
+        return None
+    table = np.load(os.path.join(entry, 'windows.npy'))
+    data = {name: np.load(os.path.join(entry, name + '.npy'), mmap_mode = 'r') for name in ['dE'] + list(columns)}
+    records = []
+    for (l1, l2, F_read, start, stop) in table.tolist():
+        start, stop = int(start), int(stop)
+        rec = fepReader.winRecord(l1, l2, columns)
+        rec.F_read = F_read
+        rec.W = data['dE'][start:stop]
+        rec.columns = {name: data[name][start:stop] for name in columns}
+        del rec._pieces
+        records.append(rec)
+    return records
+
+def _store(entry, meta, records, columns):
+    '''
+    Write a cache entry. The entry is built in a temporary directory and moved into place at the end.
+    '''
+    parent = os.path.dirname(entry)
+    os.makedirs(parent, exist_ok = True)
+    tmp = tempfile.mkdtemp(dir = parent, prefix = '.tmp-')
+    try:
+        bounds = np.cumsum([0] + [rec.W.size for rec in records])
+        table = np.array([(rec.lambda1, rec.lambda2, rec.F_read, bounds[i], bounds[i + 1]) for (i, rec) in enumerate(records)], dtype = np.float64).reshape(-1, 5)
+        np.save(os.path.join(tmp, 'windows.npy'), table)
+        np.save(os.path.join(tmp, 'dE.npy'), np.concatenate([rec.W for rec in records]) if records else np.empty(0))
+        for name in columns:
+            np.save(os.path.join(tmp, name + '.npy'), np.concatenate([rec.columns[name] for rec in records]) if records else np.empty(0))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as outfile:
+            json.dump(dict(meta, columns = list(columns), nwin = len(records)), outfile)
+        shutil.rmtree(entry, ignore_errors = True)
+        os.rename(tmp, entry)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors = True)
+        raise
+
+def _lookup(filename, columns, cache_dir, sampled_hash = False):
+    '''
+    Return (records, meta, columns): the cached records if the entry is valid and has all the columns
+    (otherwise None), the current fingerprint of the file, and the columns a new entry should hold.
+    '''
+    entry = entryPath(filename, cache_dir)
+    meta = fingerprint(filename, sampled_hash)
+    try:
+        with open(os.path.join(entry, 'meta.json')) as infile:
+            cached = json.load(infile)
+        if all(cached.get(key) == value for (key, value) in meta.items()):
+            records = _load(entry, columns)
+            if records is not None:
+                return records, meta, columns
+            columns = tuple(cached['columns']) + tuple(c for c in columns if c not in cached['columns'])
+    except (OSError, ValueError, KeyError):
+        pass # no usable entry
+    return None, meta, columns
+
+def loadFiles(filenames, columns = (), use_cache = True, cache_dir = None, workers = 1, sampled_hash = False):
+    '''
+    Return the windows of several fepout files, one list of fepReader.winRecord per file.
+    Each file is loaded from the cache if its entry is valid. All the other files are parsed together
+    (see fepReader.readFiles, workers = None uses all CPUs) and then stored in the cache.
+    columns: extra FepEnergy fields to read, see fepReader.readWindows.
+    sampled_hash: validate the entries from sampled blocks of the files instead of their whole content (see above).
+    '''
+    columns = tuple(columns)
+    if not use_cache or os.environ.get('FEPPARSER_NO_CACHE'):
+        return fepReader.readFiles(filenames, workers, columns)
+    results = []
+    missing = dict() # columns to parse -> indices of the files
+    metas = dict()
+    for (i, filename) in enumerate(filenames):
+        records, metas[i], cols = _lookup(filename, columns, cache_dir, sampled_hash)
+        results.append(records)
+        if records is None:
+            missing.setdefault(cols, []).append(i)
+    for (cols, indices) in missing.items():
+        parsed = fepReader.readFiles([filenames[i] for i in indices], workers, cols)
+        for (i, records) in zip(indices, parsed):
+            results[i] = records
+            if _unchanged(filenames[i], metas[i]): # do not cache a file that changed while being read
+                try:
+                    _store(entryPath(filenames[i], cache_dir), metas[i], records, cols)
+                except OSError as err:
+                    fepLog.warning('Cannot write the parse cache of %s: %s', filenames[i], err)
+    return results
+
+def loadWindows(filename, columns = (), use_cache = True, cache_dir = None, workers = 1, sampled_hash = False):
+    '''
+    Return the windows of a fepout file as a list of fepReader.winRecord, from the cache if it is valid,
+    otherwise by parsing the file (and then storing it in the cache).
+    '''
+    return loadFiles([filename], columns, use_cache, cache_dir, workers, sampled_hash)[0]
+
+def clearCache(filename = None, cache_dir = None):
+    '''
+    Remove the cache entry of one file, or the whole cache directory if no file is given.
+    '''
+    if filename is None:
+        shutil.rmtree(cacheDir(cache_dir), ignore_errors = True)
+    else:
+        shutil.rmtree(entryPath(filename, cache_dir), ignore_errors = True)
@@ -0,0 +1,200 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Window index of fepout files, and lazily loaded fep windows.
+-------------------------------------
+The index of a fepout file lists, for every window, the byte range [start, end) it occupies, its number of
+samples, its lambda values and the free-energy change of its '#Free energy change' line. It is built by one
+byte scan of the file (no number is converted) and kept in a sidecar file in the parse cache directory (see
+fepCache), so that nothing is written next to the data. With beside=True the sidecar is written next to the
+fepout file instead, as '<fepout>.fepidx' (falling back to the cache directory if that directory is not
+writable); a sidecar found there is always used. A sidecar holds the fingerprint of the fepout file (see
+fepCache.fingerprint: size, modification time and a hash of the whole content, or of sampled blocks with
+sampled_hash) and is rebuilt as soon as it differs, so that a file rewritten with the same length and its
+modification time restored is not served from a stale index. Every indexed window must also still start with
+a '#NEW' line.
+
+lazyWin is a fepWin that only knows its byte range. Its work is decoded from the file the first time W_list
+(or meanW, var) is used, and the decoded arrays are kept in a winCache, an LRU cache with a memory budget.
+Touching one window only costs reading that window, except in a compressed file, where every window
+read decompresses the file up to it.
+'''
+import os
+import json
+from contextlib import closing
+from collections import OrderedDict
+import fepReader
+import fepCache
+from fepInterpretor import fepWin, FWD, BWD
+from vector import vecmean, vecvar
+
+INDEX_SUFFIX = '.fepidx'
+
+class winCache:
+    '''
+    Least-recently-used cache of decoded work arrays, holding at most budget bytes.
+    The most recently added array is always kept, even if it alone exceeds the budget.
+    '''
+    def __init__(self, budget = 1 << 30):
+        self.budget = budget
+        self.used = 0
+        self.data = OrderedDict()
+
+    def get(self, key):
+        W = self.data.get(key)
+        if W is not None:
+            self.data.move_to_end(key)
+        return W
+
+    def put(self, key, W):
+        self.discard(key)
+        self.data[key] = W
+        self.used += W.nbytes
+        while self.used > self.budget and len(self.data) > 1:
+            (oldkey, old) = self.data.popitem(last = False)
+            self.used -= old.nbytes
+
+    def discard(self, key):
+        W = self.data.pop(key, None)
+        if W is not None:
+            self.used -= W.nbytes
+
+    def clear(self):
+        self.data.clear()
+        self.used = 0
+
+defaultCache = winCache()
+
+def _sidecars(filename, cache_dir = None, beside = False):
+    '''
+    Where the sidecar of a fepout file is written, in order of preference.
+    '''
+    cached = fepCache.entryPath(filename, cache_dir) + INDEX_SUFFIX
+    return [filename + INDEX_SUFFIX, cached] if beside else [cached]
+
+def buildIndex(filename):
+    '''
+    Scan a fepout file and return its index, a list of [start, end, NSamples, lambda1, lambda2, F_read].
+    '''
+    return [[rec.start, rec.end, rec.NSamples, rec.lambda1, rec.lambda2, rec.F_read]
+            for rec in fepReader.readWindows(filename, count_only = True)]
+
+def _startsWindows(filename, index):
+    '''
+    True if every window of the index starts with a '#NEW' line in the file.
+    The offsets of a compressed file are in the decompressed data and are not checked.
+    '''
+    if fepReader.compression(filename) is not None:
+        return True
+    with open(filename, 'rb') as infile:
+        for entry in index:
+            infile.seek(entry[0])
+            if infile.read(len(fepReader.NEW_MARK)) != fepReader.NEW_MARK:
+                return False
+    return True
+
+def loadIndex(filename, rebuild = False, cache_dir = None, beside = False, sampled_hash = False):
+    '''
+    Return the index of a fepout file from its sidecar if that is up to date, otherwise build and save it.
+    cache_dir: the parse cache directory (see fepCache.cacheDir); beside: write the sidecar next to the file.
+    sampled_hash: fingerprint sampled blocks of the file instead of its whole content (see fepCache).
+    '''
+    meta = fepCache.fingerprint(filename, sampled_hash)
+    if not rebuild:
+        for sidecar in _sidecars(filename, cache_dir, True):
+            try:
+                with open(sidecar) as infile:
+                    saved = json.load(infile)
+                if all(saved.get(key) == value for (key, value) in meta.items()) and _startsWindows(filename, saved['windows']):
+                    return saved['windows']
+            except (OSError, ValueError, KeyError, TypeError, IndexError):
+                continue
+    index = buildIndex(filename)
+    if not fepCache._unchanged(filename, meta): # do not save the index of a file that changed while being read
+        return index
+    for sidecar in _sidecars(filename, cache_dir, beside):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(sidecar)), exist_ok = True)
+            with open(sidecar, 'w') as outfile:
+                json.dump(dict(meta, windows = index), outfile)
+            break
+        except OSError:
+            continue
+    return index
+
+class lazyWin(fepWin):
+    '''
+    A fepWin whose work is decoded from the fepout file on first access.
+    filename, start, end: where the window is in the file
+    cache: the winCache keeping the decoded work, defaultCache if not given
+    '''
+    def __init__(self, filename, entry, Temp, maxWin = 100, cache = None):
+        fepWin.__init__(self, maxWin)
+        (self.start, self.end, self.NSamples, l1, l2, self.F_read) = entry
+        self.filename = filename
+        self.cache = defaultCache if cache is None else cache
+        self.lambda1 = l1
+        self.lambda2 = l2
+        self.direction = FWD if l1 < l2 else BWD
+        self.label = self.label_format % (min(l1, l2), max(l1, l2))
+        self.set_temperature(Temp)
+        self._W = None
+        self._meanW = None
+        self._var = None
+
+    def _key(self):
+        return (self.filename, self.start)
+
+    def _getW(self):
+        if self._W is not None:
+            return self._W
+        W = self.cache.get(self._key())
+        if W is None:
+            with closing(fepReader.readWindows(self.filename, start = self.start, end = self.end)) as records:
+                W = next(records).W
+            self.cache.put(self._key(), W)
+        return W
+
+    def _setW(self, works):
+        self._W = works
+
+    def _delW(self):
+        self._W = None
+        self.cache.discard(self._key())
+
+    W_list = property(_getW, _setW, _delW)
+
+    def _getMean(self):
+        if self._meanW is None:
+            self._meanW = vecmean(self.W_list)
+        return self._meanW
+
+    def _setMean(self, value):
+        self._meanW = value
+
+    meanW = property(_getMean, _setMean)
+
+    def _getVar(self):
+        if self._var is None:
+            self._var = vecvar(self.W_list)
+        return self._var
+
+    def _setVar(self, value):
+        self._var = value
+
+    var = property(_getVar, _setVar)
+
+    def clear_raw_data(self):
+        del self.W_list
+        self.columns = dict()
+
+def lazyWindows(filename, Temp, maxWin = 100, cache = None, cache_dir = None, beside = False, sampled_hash = False):
+    '''
+    Return a lazyWin for every window of a fepout file, using (and if needed building) its index.
+    cache_dir, beside, sampled_hash: where the index sidecar is kept and how it is validated, see loadIndex.
+    '''
+    index = loadIndex(filename, cache_dir = cache_dir, beside = beside, sampled_hash = sampled_hash)
+    return [lazyWin(filename, entry, Temp, maxWin, cache) for entry in index]
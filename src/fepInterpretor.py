@@ -9,34 +9,56 @@ To-do list:
 1. User define the maximun iterations numbers for bar estimation.
 2. A GUI.
 3. Plotting functions for free energy and histogram.
-4. Using bootstrap to estimate the error of BAR calculation
 -------------------------------------
 '''
-from sys import exit
+from sys import exit # only used by the command line, run()
+from array import array
 from vector import *
+import math
 import BAR
+import fepReader
+import fepCache
+import bootstrap
+import autocorr
+import convergence
+import estimators
+import Histogram
+import fepSummary
+import fepSpill
+import fepParallel
+import fepLog
+import numpy as np
 
 # forward and backward mark
 FWD = 'fwd'
 BWD = 'bwd'
+LAMBDA_TOL = 1e-6 # lambda values closer than this are the same
+
+def lambdaKey(l1, l2, tol = LAMBDA_TOL):
+    '''
+    Key identifying a window whatever its direction: its lower and upper lambda, as integer multiples of tol.
+    Unlike the label, it does not depend on label_format, so windows are never matched through rounding.
+    '''
+    return (round(min(l1, l2) / tol), round(max(l1, l2) / tol))
 
 def genHist(Datalist, min_value, max_value, Nintervals=250):
     '''
     Generate a unified histogram for given data.
     ======================
     Datalist: an iterable that contains all the data
+    Data out of [min_value, max_value] is discarded. Binning is done by Histogram.histCounts in one pass.
+    '''
+    hist = Histogram.histCounts(Datalist, min_value, max_value, Nintervals)
+    total = hist.sum()
+    return hist / total if total else hist.astype(np.float64)
+
+def _readonly(data):
+    '''
+    A read-only view of an array, sharing its memory.
     '''
-    total = 0
-    delta = (max_value - min_value) / Nintervals
-    hist = [0] * Nintervals
-    for f in Datalist:
-        if f < min or f > max:
-            # discard data out of range
-            continue 
-        total += 1
-        ind = int((f - min) / delta)
-        hist[ind] += 1
-    return [(f / total) for f in hist]
+    view = np.asarray(data).view()
+    view.flags.writeable = False
+    return view
 
 class fepWin:
     '''
@@ -51,8 +73,20 @@ class fepWin:
     label_format: by default %.2f-%.2f 
     max_num_win: by default 100 wins.
     meanW: average work
+    F_read: free-energy change recorded in the '#Free energy change' line of the fepout file, if read from one
+    columns: dictionary of extra FepEnergy fields (see fepReader.COLUMNS) read along with the work, one array each
+    summary: running statistics of the work (fepSummary.winSummary), for windows read in summary mode
+    dtype: storage type of W_list, np.float64 by default; np.float32 halves the memory
+           (the estimators still compute in double precision)
+    -------------------------------------
+    Memory: W_list is a contiguous array, 8 bytes per sample (4 with float32), where a list of Python floats
+    takes about 32 (an 8-byte pointer and a 24-byte float object). For 100 windows x 500k samples that is
+    400 MB (200 MB with float32) instead of about 1.6 GB. The attributes live in __slots__, without a __dict__.
     '''
-    def __init__(self, max_nWin = 100):
+    __slots__ = ('max_num_win', 'label_format', 'lambda1', 'lambda2', 'direction', 'NSamples', 'W_list', 'var',
+                 'label', 'meanW', 'temperature', 'F_read', 'columns', 'summary', 'dtype', '__weakref__')
+
+    def __init__(self, max_nWin = 100, dtype = np.float64):
         format_of_label_format = '%.{0}f-%.{0}f'
         # determine the label format first
         i = 1
@@ -66,12 +100,16 @@ class fepWin:
         self.lambda1 = 0.0
         self.lambda2 = 0.0
         self.direction = None
+        self.dtype = np.dtype(dtype)
         self.NSamples = 0
-        self.W_list = []
+        self.W_list = np.empty(0, dtype = self.dtype)
         self.var = 0.0
         self.label = None 
         self.meanW = 0.0
         self.temperature = 303.15 # default temperature, required in BAR estimation.
+        self.F_read = None
+        self.columns = dict()
+        self.summary = None
     
     def set_temperature(self, temp):
         '''
@@ -81,21 +119,23 @@ class fepWin:
     
     def copy(self):
         '''
-        Make a copy if sometimes necessary
-        '''
-        newWin = fepWin()
-        newWin.lambda1 = self.lambda1
-        newWin.lambda2 = self.lambda2
-        newWin.direction = self.direction
-        newWin.label = self.label
-        newWin.label_format = self.label_format
-        newWin.max_num_win = self.max_num_win
-        newWin.NSamples = self.NSamples
-        newWin.W_list = self.W_list.copy()
-        newWin.var = self.var
-        newWin.meanW = self.meanW
+        Make a cheap copy: the work and column arrays are shared, as read-only views.
+        Writing into them raises an error instead of changing the original; set() gives the copy new data.
+        '''
+        newWin = fepWin.__new__(fepWin)
+        for name in fepWin.__slots__[:-1]:
+            if hasattr(self, name): # W_list is missing after clear_raw_data()
+                setattr(newWin, name, getattr(self, name))
+        if hasattr(self, 'W_list'):
+            newWin.W_list = _readonly(self.W_list)
+        newWin.columns = {name: _readonly(data) for (name, data) in self.columns.items()}
+        return newWin
     
-    def set(self, l1, l2, works = []):
+    def _setLambdas(self, l1, l2, n):
+        '''
+        Set the lambda values, direction and label of the window, checking them and the number of samples n.
+        Shared by set() and set_summary().
+        '''
         self.lambda1 = l1
         self.lambda2 = l2
         if self.lambda1 < self.lambda2:
@@ -103,25 +143,38 @@ class fepWin:
         elif self.lambda1 > self.lambda2:
             self.direction = BWD
         else:
-            print('ERROR: Lambda1 is equal to Lambda2! Exit. Check you input. Lambda1 = Lambda2 = %.2f' % self.lambda1)
-            exit()
-        if len(works) == 0:
-            print('ERROR: No recorded work given. Exit.')
-            exit()
-        self.NSamples = len(works)
-        self.W_list = works
-        self.var = vecvar(self.W_list)
+            raise ValueError('Lambda1 is equal to Lambda2! Check your input. Lambda1 = Lambda2 = %.2f' % self.lambda1)
+        if n == 0:
+            raise ValueError('No recorded work given for window %g -> %g.' % (l1, l2))
+        self.NSamples = n
         self.label = self.label_format % (min(l1, l2), max(l1, l2))
+    
+    def set(self, l1, l2, works = []):
+        self._setLambdas(l1, l2, len(works))
+        self.W_list = np.asarray(works, dtype = self.dtype)
+        self.var = vecvar(self.W_list)
         self.meanW = vecmean(self.W_list)
-        print('FEP window recorded. Lable: %s.' % self.label, self.direction)
+        fepLog.info('FEP window recorded. Lable: %s. %s', self.label, self.direction)
+    
+    def set_summary(self, l1, l2, summary):
+        '''
+        Set the window from running statistics instead of the work list, e.g. when the raw samples were discarded.
+        meanW and var are taken from the summary; W_list is left empty.
+        '''
+        self._setLambdas(l1, l2, summary.n)
+        self.summary = summary
+        self.W_list = np.empty(0, dtype = self.dtype)
+        self.var = summary.std()
+        self.meanW = summary.mean
+        fepLog.info('FEP window summary recorded. Lable: %s. %s', self.label, self.direction)
     
     def set_from_file(self, filename):
         '''
         If the data of a single is extracted from the fepout file, then the user can read from such file the data of the FEP window.
         '''
-        print('Reading from file. Note that the file must not contain more than one windows!')
-        W = []
-        for line in open(filename):
+        fepLog.info('Reading from file. Note that the file must not contain more than one windows!')
+        W = array('d')
+        for line in fepReader.openFepout(filename, 'r'): # gzip, bz2 and xz files are decompressed on the fly
             buff = line.split()
             if line.startswith('#NEW'): 
                 l1 = float(buff[6])
@@ -130,15 +183,32 @@ class fepWin:
                 W.append(float(buff[6]))
         self.set(l1, l2, W)
     
+    def work(self, component = 'dE'):
+        '''
+        Return the work of one energy component:
+        'dE' is the total work (W_list), 'elec' is elec_ldl - elec_l, 'vdw' is vdw_ldl - vdw_l,
+        and any other name is returned as the raw column. The columns needed must have been read.
+        '''
+        if component == 'dE':
+            return self.W_list
+        needed = {'elec': ('elec_l', 'elec_ldl'), 'vdw': ('vdw_l', 'vdw_ldl')}.get(component, (component,))
+        for name in needed:
+            if name not in self.columns:
+                raise KeyError('Column %s was not read for window %s. Read the file with columns=%s.' % (name, self.label, needed))
+        if len(needed) == 2:
+            return self.columns[needed[1]] - self.columns[needed[0]]
+        return self.columns[component]
+    
     def clear_raw_data(self):
         '''
         Delete the work list to save memory if needed. E.g. such data is no longer needed after all calculations finished for a window pair.
         '''
         del self.W_list
+        self.columns = dict()
         
         
     @classmethod
-    def winYield(cls, filename, Temp, maxWin=100):
+    def winYield(cls, filename, Temp, maxWin=100, dtype=np.float64):
         '''
         Go through the fepout file and generate a series of fepWin objects.
         This is a fepout file reader.
@@ -146,20 +216,22 @@ class fepWin:
         Received parameters:
         filename: the fep output file
         Temp: Temperature assigned for BAR estimation, unit in K (Kelvin).
+        dtype: storage type of the work arrays (see fepWin)
         '''
         l1 = 0
         l2 = 0
-        W = []
-        for line in open(filename):
+        W = array('d')
+        for line in fepReader.openFepout(filename, 'r'): # gzip, bz2 and xz files are decompressed on the fly
             buff = line.split()
             if line.startswith('#Free energy change'): # End of a window
-                fwin = fepWin(maxWin)
+                fwin = fepWin(maxWin, dtype)
                 fwin.set(l1, l2, W)
                 fwin.set_temperature(Temp)
+                fwin.F_read = float(buff[11])
                 # reset
                 l1 = 0
                 l2 = 0
-                W = []
+                W = array('d')
                 yield fwin
             if line.startswith('#NEW'): # Beginning of a new window
                 l1 = float(buff[6])
@@ -167,6 +239,62 @@ class fepWin:
             if line.startswith('FepEnergy:'):
                 W.append(float(buff[6]))
     
+    @classmethod
+    def fromRecord(cls, rec, Temp, maxWin=100, dtype=np.float64):
+        '''
+        Make a fepWin from a window record of the bulk reader (fepReader.winRecord).
+        The work array is used as it is (not copied) when it already has the storage type dtype.
+        '''
+        fwin = fepWin(maxWin, dtype)
+        fwin.set(rec.lambda1, rec.lambda2, rec.W)
+        fwin.set_temperature(Temp)
+        fwin.F_read = rec.F_read
+        fwin.columns = rec.columns
+        return fwin
+    
+    @classmethod
+    def bulkYield(cls, filename, Temp, maxWin=100, chunk_size=fepReader.CHUNK_SIZE, columns=(), use_cache=False, cache_dir=None, workers=1, dtype=np.float64, spill=None):
+        '''
+        Same as winYield, but the file is parsed by the bulk reader in fepReader,
+        and W_list of each window is a float64 array.
+        columns: extra FepEnergy fields to keep in fepWin.columns, e.g. ('elec_l', 'elec_ldl', 'vdw_l', 'vdw_ldl').
+        use_cache: load the windows from the on-disk parse cache (see fepCache), and fill it if it is out of date.
+                   The work arrays are then read-only memory-mapped views.
+        workers: number of processes parsing chunks of the file in parallel (None for all CPUs).
+        dtype: storage type of the work arrays, e.g. np.float32 to halve the memory (see fepWin).
+        spill: a fepSpill.spillDir, to keep the work of every window in a memory-mapped spill file
+               instead of in memory (out-of-core mode). Use it with the default dtype, or the work is copied back.
+        '''
+        if use_cache:
+            records = fepCache.loadWindows(filename, columns, cache_dir = cache_dir, workers = workers)
+        elif workers != 1 and spill is None:
+            records = fepReader.parallelReadWindows(filename, workers, columns)
+        else:
+            records = fepReader.readWindows(filename, chunk_size, columns, spill = spill)
+        for rec in records:
+            fwin = cls.fromRecord(rec, Temp, maxWin, dtype)
+            if spill is not None: # set() has read the whole window, for its mean and variance
+                fepSpill.release(rec.W)
+            yield fwin
+    
+    @classmethod
+    def summaryYield(cls, filename, Temp, lo, hi, Nintervals=250, maxWin=100, keep_raw=False):
+        '''
+        Read a fepout file in summary mode: each window gets running moments, min/max, a histogram on the fixed
+        grid of Nintervals bins over [lo, hi] and the EXP statistics, updated while the file is read.
+        Unless keep_raw is True, the raw samples are discarded at once, so that memory stays O(windows x bins).
+        '''
+        for rec in fepReader.readWindows(filename, summary = fepSummary.factory(Temp, lo, hi, Nintervals), keep_raw = keep_raw):
+            fwin = fepWin(maxWin)
+            if keep_raw:
+                fwin.set(rec.lambda1, rec.lambda2, rec.W)
+                fwin.summary = rec.summary
+            else:
+                fwin.set_summary(rec.lambda1, rec.lambda2, rec.summary)
+            fwin.set_temperature(Temp)
+            fwin.F_read = rec.F_read
+            yield fwin
+    
 class fepHistogram:
     def __init__(self, l, hist_f, hist_b):
         '''
@@ -174,13 +302,14 @@ class fepHistogram:
         hist_f: unified histogram of forward works
         hist_b: unified histogram of backward works
         '''
+        self.x = l
         self.fwd_hist = hist_f
         self.bwd_hist = hist_b
 
 class winPair:
     '''
     Constructed by the corresponding forward and backward windows, and estimate the free energy change using BAR.
-    The label of the forward and backward windows must match!
+    The lambda values of the forward and backward windows must match (see lambdaKey)!
     -------------------------------------
     fwd_win: forward window
     bwd_win: backward window
@@ -189,49 +318,138 @@ class winPair:
     
     calcDF(): calculate the free energy difference
     calcError(): estimate the error of BAR estimation
+    calcEstimates(): EXP, BAR and Gaussian estimates side by side, checked against F_read (see estimators)
     clear_raw_data(): delete the work lists of the forward and backward windows.
     '''
+    __slots__ = ('fwd_win', 'bwd_win', 'label', 'hist_f', 'hist_b', 'hist', 'DF', 'error_F', 'components',
+                 'g_f', 'g_b', 'subsample_f', 'subsample_b', 'convergence', 'estimates', '__weakref__')
+
     def __init__(self, win_f, win_b):
-        if win_f.label != win_b.label:
-            print('ERROR: Must be within the same windows! Exit.')
-            exit()
+        if lambdaKey(win_f.lambda1, win_f.lambda2) != lambdaKey(win_b.lambda1, win_b.lambda2):
+            raise ValueError('Must be within the same windows! %s and %s.' % (win_f.label, win_b.label))
         if win_f.direction == win_b.direction:
-            print('ERROR: Must be opposite directions! Exit.')
-            exit()
+            raise ValueError('Must be opposite directions! Window %s.' % win_f.label)
         if win_f.temperature != win_b.temperature:
-            print('Windows are NOT assigned with the same temperature! Exit.')
-            exit()
+            raise ValueError('Windows are NOT assigned with the same temperature! Window %s.' % win_f.label)
         self.fwd_win = win_f
         self.bwd_win = win_b 
         self.label = win_f.label
         self.hist_f = None
         self.hist_b = None
+        self.hist = None # fepHistogram, with the shared x coordinates
         self.DF = 0
         self.error_F = 0
+        self.components = dict() # component -> (DF from BAR, DF from forward EXP, DF from reverse EXP)
+        self.g_f = 1.0 # statistical inefficiency of the forward work
+        self.g_b = 1.0 # statistical inefficiency of the backward work
+        self.subsample_f = None # indices of the uncorrelated forward samples, if subsampled
+        self.subsample_b = None # indices of the uncorrelated backward samples, if subsampled
+        self.convergence = None # time-convergence table, see calcConvergence
+        self.estimates = None # estimator -> DF, and 'flags', see calcEstimates
+    
+    def subsample(self):
+        '''
+        Find the uncorrelated subsamples of both work lists from their autocorrelation (see autocorr).
+        After this, calcDF and calcError only use those samples.
+        '''
+        with fepLog.stage('subsample', window = self.label) as event:
+            autocorr.subsamplePairs([self])
+            event.update(g_f = self.g_f, g_b = self.g_b)
+        fepLog.info("Window [ %s ] subsampled: statistical inefficiency %.2f (forward), %.2f (backward).", self.label, self.g_f, self.g_b)
+    
+    def works(self, component = 'dE'):
+        '''
+        The forward and backward work used by the estimators: the uncorrelated subsamples if subsample() was called.
+        component: the energy component (see fepWin.work), by default the total work
+        '''
+        W_F = self.fwd_win.work(component)
+        W_R = self.bwd_win.work(component)
+        if self.subsample_f is not None:
+            W_F = np.asarray(W_F)[self.subsample_f]
+            W_R = np.asarray(W_R)[self.subsample_b]
+        return W_F, W_R
     
     def calcDF(self):
         '''
         This is the core function of fep analysis.
+        error_F is set to the asymptotic BAR error, which comes with the estimate at no extra cost.
+        calcError() replaces it with a bootstrap error, for the windows where that is wanted.
+        '''
+        with fepLog.stage('calcDF', window = self.label) as event:
+            W_F, W_R = self.works()
+            barMachine = BAR.BARestimator(W_F, W_R, self.fwd_win.temperature)
+            self.DF = barMachine.BARSC(self.fwd_win.meanW) # The default parameters are good enough
+            self.error_F = math.sqrt(barMachine.variance)
+            event.update(iterations = barMachine.niter, residual = barMachine.residual, DF = self.DF, error = self.error_F)
+        fepLog.info("Free energy change for window [ %s ] calculated.", self.label)
+    
+    def calcConvergence(self, fractions = 10):
         '''
-        barMachine = BAR.BARestimator(self.fwd_win.W_list, self.bwd_win.W_list)
-        self.DF = barMachine.BARSC(self.fwd_win.meanW) # The default parameters are good enough
-        print("Free energy change for window [ %s ] calculated." % self.label)
+        BAR estimates on the first and on the last 1/fractions, 2/fractions, ... of the data (see convergence).
+        The table, a list of (fraction, DF forward in time, error, DF reverse in time, error), is kept in self.convergence.
+        '''
+        with fepLog.stage('convergence', window = self.label, fractions = fractions) as event:
+            W_F, W_R = self.works()
+            self.convergence, event['passes'] = convergence.convergenceProfile(W_F, W_R, self.fwd_win.temperature, fractions, self.fwd_win.meanW)
+        fepLog.info("Convergence table for window [ %s ] calculated.", self.label)
+        return self.convergence
+    
+    def calcEstimates(self, tol = 0.5, read_tol = 0.01):
+        '''
+        Forward EXP, reverse EXP, BAR and the Gaussian estimates of the window (see estimators), kept in self.estimates
+        with the list of their disagreements under 'flags'. DF and error_F are set from BAR, as calcDF does.
+        The EXP values are checked against F_read unless the work was subsampled.
+        '''
+        with fepLog.stage('estimators', window = self.label) as event:
+            W_F, W_R = self.works()
+            self.estimates = estimators.multiEstimate(W_F, W_R, self.fwd_win.temperature, self.fwd_win.meanW)
+            if self.subsample_f is None:
+                flags = estimators.crossCheck(self.estimates, self.fwd_win.F_read, self.bwd_win.F_read, tol, read_tol)
+            else:
+                flags = estimators.crossCheck(self.estimates, tol = tol)
+            self.estimates['flags'] = flags
+            self.DF = self.estimates['BAR']
+            self.error_F = self.estimates['BAR_error']
+            event.update(DF = self.DF, passes = self.estimates['passes'], flags = len(flags))
+        if flags:
+            fepLog.warning('Estimators disagree for window [ %s ]: %s.', self.label, ', '.join(flags))
+        return self.estimates
+    
+    def calcComponentDF(self, component):
+        '''
+        BAR and EXP estimates of the free-energy change of one energy component ('elec', 'vdw', ... see fepWin.work),
+        computed on the columns already read from the fepout files (only the uncorrelated samples after subsample()).
+        '''
+        W_F, W_R = self.works(component)
+        T = self.fwd_win.temperature
+        EXP_F = BAR.EXPestimate(W_F, T)
+        barMachine = BAR.BARestimator(W_F, W_R, T)
+        DF = barMachine.BARSC(EXP_F)
+        self.components[component] = (DF, EXP_F, -BAR.EXPestimate(W_R, T))
+        fepLog.info("Free energy change of component %s for window [ %s ] calculated.", component, self.label)
+        return self.components[component]
     
-    def calcError(self):
+    def calcError(self, nboot = 200, seed = None, workers = 1):
         '''
         Use bootstrap to estimate the error of BAR estimation.
+        The replicates are solved in batches, starting from DF, so calcDF should be called first.
+        seed: makes the estimate reproducible (see bootstrap.bootstrapDF); workers: number of processes.
         '''
-        pass
+        with fepLog.stage('bootstrap', window = self.label, nboot = nboot, workers = workers) as event:
+            W_F, W_R = self.works()
+            self.error_F = bootstrap.bootstrapError(W_F, W_R, self.fwd_win.temperature, self.DF, nboot, seed, workers)
+            event['error'] = self.error_F
+        fepLog.info("Bootstrap error for window [ %s ] calculated, with %d replicates.", self.label, nboot)
+        return self.error_F
     
     def calcHist(self, Nintervals = 250):
         '''
         Generate the histogram based on both work lists
         '''
-        min_W = min(min(self.fwd_win.W_list), min(self.bwd_win.W_list))
-        max_W = max(max(self.fwd_win.W_list), max(self.bwd_win.W_list))
-        self.hist_f = genHist(self.fwd_win.W_list, min_W, max_W, Nintervals)
-        self.hist_b = genHist(self.bwd_win.W_list, min_W, max_W, Nintervals)
-        
+        with fepLog.stage('histogram', window = self.label, samples = len(self.fwd_win.W_list) + len(self.bwd_win.W_list)):
+            x, self.hist_f, self.hist_b = Histogram.pairHist(self.fwd_win.W_list, self.bwd_win.W_list, Nintervals)
+        self.hist = fepHistogram(x, self.hist_f, self.hist_b)
+
     
     def clear_raw_data(self):
         self.fwd_win.clear_raw_data()
@@ -239,24 +457,40 @@ class winPair:
 
 
 
+def writeHistograms(pairs, Nintervals = 250, prefix = ''):
+    '''
+    Histogram all window pairs (those not histogrammed yet) and write the forward and backward histograms
+    to Fwd_Histogram.dat and Rvs_Histogram.dat, in lambda order.
+    '''
+    pairs = fepParallel.lambdaOrder(pairs)
+    for p in pairs:
+        if p.hist is None:
+            p.calcHist(Nintervals)
+    for (name, attr) in (('Fwd', 'fwd_hist'), ('Rvs', 'bwd_hist')):
+        filename = prefix + name + '_Histogram.dat'
+        with open(filename, 'w') as outfile:
+            for p in pairs:
+                l = (p.fwd_win.lambda1, p.fwd_win.lambda2)
+                outfile.write('# Probability of Window [ %4.2f, %4.2f ]\n' % (min(l), max(l)))
+                outfile.write(Histogram.formatHist(p.hist.x, getattr(p.hist, attr)))
+        fepLog.info('File %s written.', filename)
+
 def run():
+    import fepAnalysis # not at the top: fepAnalysis imports this module
     max_num_wins = 100
     temperature = 298
     fwd_filename = r'D:\work\2012_Carrier\FEP_CD_Anihilation\Alchem_C1_Unbound\forward.fepout'
     bwd_filename = r'D:\work\2012_Carrier\FEP_CD_Anihilation\Alchem_C1_Unbound\backward.fepout'
-    print("Reading forward fepout file...")
-    fwd_wins = [win for win in fepWin.winYield(fwd_filename, temperature, max_num_wins)]
-    print("Reading backward fepout file...")
-    bwd_wins = [win for win in fepWin.winYield(bwd_filename, temperature, max_num_wins)]
-    # Debug
-    fw = fwd_wins[0]
-    for w in bwd_wins:
-        if w.label == fw.label:
-            print("Found!!!!!!!")
-    
-    print(w.label)
-    
-    return
+    print("Reading forward and backward fepout files...")
+    try:
+        # both files parsed at the same time through the parse cache, the pairs solved on all CPUs
+        profile = fepAnalysis.analyze(fwd_filename, bwd_filename, temperature, max_num_wins, use_cache = True, workers = None)
+    except (OSError, ValueError, KeyError) as err:
+        fepLog.error('%s Exit.', err)
+        exit(1)
+    for (lo, hi, DF, error_F, F, error) in profile.windows:
+        print('[ %4.2f, %4.2f ] %10.4f %8.4f %10.4f %8.4f' % (lo, hi, DF, error_F, F, error))
+    print('Free energy change: %.4f +- %.4f kcal/mol' % (profile.F, profile.error))
     
 
 if __name__ == "__main__":
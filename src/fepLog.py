@@ -0,0 +1,152 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Messages and stage-level instrumentation.
+-------------------------------------
+Messages go through the logging module, to the logger 'fepparser'. The progress messages of every window are
+at INFO level and are not shown by default; warnings and errors are, on stderr, prefixed with their level
+('WARNING: ...'), so messages are written without it. verbose() prints the progress messages to stdout again,
+as before. Setting the environment variable FEPPARSER_VERBOSE does the same at import.
+Library code raises exceptions on bad input; error() is for the command-line entry points reporting them.
+
+With recording enabled (enable()), every pipeline stage adds an event: a dictionary with the stage name, its
+wall time in seconds and its counters, e.g. bytes and samples for 'parse', iterations and residual for 'bar'.
+Events are kept in memory until reset(); writeJSON and writeCSV save them, summary() adds them up per stage.
+Stages recorded:
+    parse          one fepout file read by fepReader.readWindows: bytes, windows, samples
+    parse_window   one window of it: lambda1, lambda2, bytes, samples (no time, the scan is not per window)
+    bar            one BARestimator.BARSC run: N_F, N_R, method, iterations, residual, DF
+    calcDF         winPair.calcDF: window, iterations, residual, DF, error
+    histogram      winPair.calcHist: window, samples
+    bootstrap      winPair.calcError: window, nboot, workers, error
+    subsample      winPair.subsample: window, g_f, g_b
+    convergence    winPair.calcConvergence: window, fractions, passes
+    estimators     winPair.calcEstimates: window, DF, passes, flags
+    analyze        fepAnalysis.analyze, one leg: fwd, bwd, workers, windows
+    batch          fepBatch.runBatch: legs, replicas, workers
+    batch_leg      one leg of it: leg, replicas
+'''
+import os
+import sys
+import csv
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger('fepparser')
+
+_handler = None
+_enabled = False
+
+# warnings and errors on stderr, with their level
+_stderr = logging.StreamHandler()
+_stderr.setLevel(logging.WARNING)
+_stderr.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+logger.addHandler(_stderr)
+_events = []
+
+# Counters that make sense summed over the events of a stage.
+ADDITIVE = ('seconds', 'bytes', 'windows', 'samples', 'N_F', 'N_R', 'iterations', 'nboot')
+
+def verbose(on = True):
+    '''
+    Print the progress messages (INFO level) to stdout, or stop printing them.
+    '''
+    global _handler
+    if on and _handler is None:
+        _handler = logging.StreamHandler(sys.stdout)
+        _handler.setFormatter(logging.Formatter('%(message)s'))
+        _handler.addFilter(lambda record: record.levelno < logging.WARNING) # those go to stderr
+        logger.addHandler(_handler)
+        logger.setLevel(logging.INFO)
+    elif not on and _handler is not None:
+        logger.removeHandler(_handler)
+        _handler = None
+        logger.setLevel(logging.NOTSET)
+
+def info(msg, *args):
+    logger.info(msg, *args)
+
+def warning(msg, *args):
+    logger.warning(msg, *args)
+
+def error(msg, *args):
+    logger.error(msg, *args)
+
+def enable(on = True):
+    '''
+    Start (or stop) recording the stage events.
+    '''
+    global _enabled
+    _enabled = on
+
+def enabled():
+    return _enabled
+
+def record(name, seconds = None, **counters):
+    '''
+    Add one event, if recording is enabled.
+    '''
+    if _enabled:
+        _events.append(dict(stage = name, seconds = seconds, **counters))
+
+@contextmanager
+def stage(name, **counters):
+    '''
+    Time a stage and record it as one event. The dictionary yielded holds the counters of the event,
+    and more can be added to it inside the with block:
+        with fepLog.stage('bar', N_F = n) as event:
+            ...
+            event['iterations'] = niter
+    '''
+    event = dict(counters)
+    if not _enabled:
+        yield event
+        return
+    t0 = time.perf_counter()
+    yield event
+    record(name, time.perf_counter() - t0, **event)
+
+def events():
+    return list(_events)
+
+def reset():
+    del _events[:]
+
+def summary():
+    '''
+    Events added up per stage: {stage: {'count': ..., 'seconds': ..., counter: sum, ...}}, for the counters in ADDITIVE.
+    '''
+    stages = dict()
+    for event in _events:
+        total = stages.setdefault(event['stage'], {'count': 0, 'seconds': 0.0})
+        total['count'] += 1
+        for key in ADDITIVE:
+            if event.get(key) is not None:
+                total[key] = total.get(key, 0) + event[key]
+    return stages
+
+def writeJSON(filename):
+    with open(filename, 'w') as outfile:
+        json.dump({'events': _events, 'summary': summary()}, outfile, indent = 1)
+    info('File %s written.', filename)
+
+def writeCSV(filename):
+    '''
+    One row per event; the columns are the union of the counters of all events, missing ones left empty.
+    '''
+    fields = ['stage', 'seconds']
+    for event in _events:
+        fields.extend(key for key in event if key not in fields)
+    with open(filename, 'w', newline = '') as outfile:
+        writer = csv.DictWriter(outfile, fields)
+        writer.writeheader()
+        writer.writerows(_events)
+    info('File %s written.', filename)
+
+if os.environ.get('FEPPARSER_VERBOSE'):
+    verbose()
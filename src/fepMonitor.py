@@ -0,0 +1,195 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Incremental reading of fepout files that are still being written, and live BAR estimates.
+-------------------------------------
+A fepFollower remembers how far it has read a fepout file and the state of the window being read. Each poll()
+reads only the bytes appended since the last one, up to the last complete line; a half-written last line is
+left for the next poll. The state can be saved to, and restored from, a checkpoint file; the work of every
+finished window is written to the checkpoint only once.
+
+liveBAR follows the forward and backward files of one leg and keeps a BAR estimate for every window pair,
+including the windows still being written. Finished pairs are solved only once.
+'''
+import os
+import json
+import numpy as np
+import fepReader
+import BAR
+from fepInterpretor import lambdaKey
+
+class fepFollower:
+    '''
+    Follow a growing fepout file.
+    -----------
+    filename: the fepout file
+    offset: number of bytes already consumed (always the end of a complete line)
+    windows: the winRecord of every finished window, in file order
+    '''
+    def __init__(self, filename, columns = ()):
+        self.filename = filename
+        self.columns = tuple(columns)
+        self.offset = 0
+        self.windows = []
+        self._state = [None] # the window being read, as in fepReader._scanChunk
+        self._saved = dict() # checkpoint path -> number of finished windows already written there
+
+    def poll(self, chunk_size = fepReader.CHUNK_SIZE):
+        '''
+        Read the data appended since the last poll. Return the list of windows finished by it.
+        If the file got shorter (rewritten from the start), it is read again from the beginning.
+        '''
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError: # not created yet
+            return []
+        if size < self.offset:
+            self.__init__(self.filename, self.columns)
+        finished = []
+        with open(self.filename, 'rb') as infile:
+            infile.seek(self.offset)
+            carry = b''
+            while True:
+                chunk = infile.read(chunk_size)
+                if not chunk:
+                    break
+                buff = carry + chunk if carry else chunk
+                last = buff.rfind(b'\n') + 1
+                carry = buff[last:]
+                finished.extend(fepReader._scanChunk(buff, last, self._state, self.columns, self.offset))
+                self.offset += last
+        self.windows.extend(finished)
+        return finished
+
+    def current(self):
+        '''
+        The window being written, as a winRecord holding the samples read so far, or None.
+        '''
+        rec = self._state[0]
+        if rec is None:
+            return None
+        partial = fepReader.winRecord(rec.lambda1, rec.lambda2, rec._names)
+        partial.start = rec.start
+        partial._pieces = [list(p) for p in rec._pieces]
+        partial._finish()
+        return partial
+
+    def checkpoint(self, path):
+        '''
+        Save the state of the follower to the .npz file path: the offset, the list of finished windows and
+        the partial window. The work of each finished window is written only once, by the first checkpoint
+        after it finished, to its own .npy files in the directory path + '.windows'; later checkpoints only
+        list those files, so that each costs O(new data).
+        '''
+        folder = path + '.windows'
+        os.makedirs(folder, exist_ok = True)
+        saved = self._saved.get(path, 0)
+        for (i, rec) in enumerate(self.windows[saved:], saved):
+            for (name, data) in [('W', rec.W)] + [(name, rec.columns[name]) for name in self.columns]:
+                tmp = os.path.join(folder, '%s_%d.tmp.npy' % (name, i))
+                np.save(tmp, data)
+                os.replace(tmp, os.path.join(folder, '%s_%d.npy' % (name, i)))
+        self._saved[path] = len(self.windows)
+        meta = {'filename': self.filename, 'columns': list(self.columns), 'offset': self.offset,
+                'windows': [[rec.lambda1, rec.lambda2, rec.F_read, rec.start, rec.end] for rec in self.windows]}
+        arrays = dict()
+        rec = self.current()
+        meta['partial'] = None if rec is None else [rec.lambda1, rec.lambda2, rec.start]
+        if rec is not None:
+            arrays['W'] = rec.W
+            for name in self.columns:
+                arrays[name] = rec.columns[name]
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, meta = np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def fromCheckpoint(cls, path):
+        '''
+        Restore a follower saved by checkpoint(). The work of the finished windows is memory-mapped from their files.
+        '''
+        data = np.load(path)
+        meta = json.loads(str(data['meta']))
+        follower = cls(meta['filename'], meta['columns'])
+        follower.offset = meta['offset']
+        folder = path + '.windows'
+        for (i, (l1, l2, F_read, start, end)) in enumerate(meta['windows']):
+            rec = fepReader.winRecord(l1, l2, follower.columns)
+            rec.F_read = F_read
+            rec.start = start
+            rec.end = end
+            arrays = [np.load(os.path.join(folder, '%s_%d.npy' % (name, i)), mmap_mode = 'r') for name in ('W',) + follower.columns]
+            rec.W = arrays[0]
+            rec.columns = dict(zip(follower.columns, arrays[1:]))
+            rec.NSamples = rec.W.size
+            del rec._pieces
+            follower.windows.append(rec)
+        follower._saved[path] = len(follower.windows)
+        if meta['partial'] is not None:
+            (l1, l2, start) = meta['partial']
+            rec = fepReader.winRecord(l1, l2, follower.columns)
+            rec.start = start
+            rec._pieces = [[data[name]] for name in ('W',) + follower.columns]
+            follower._state[0] = rec
+        return follower
+
+def _key(rec):
+    return lambdaKey(rec.lambda1, rec.lambda2)
+
+class liveBAR:
+    '''
+    Live BAR estimate of one leg, from the forward and backward fepout files being written.
+    -----------
+    Call update() periodically; it returns the current profile as a list of tuples
+    (lambda_low, lambda_high, DF, cumulative F, finished), in lambda order,
+    where finished tells whether both windows of the pair are complete.
+    '''
+    def __init__(self, fwd_filename, bwd_filename, Temperature, fwd_follower = None, bwd_follower = None):
+        self.Temp = Temperature
+        self.fwd = fepFollower(fwd_filename) if fwd_follower is None else fwd_follower
+        self.bwd = fepFollower(bwd_filename) if bwd_follower is None else bwd_follower
+        self.DF = dict() # key (see lambdaKey) -> DF of the finished pairs
+        self.lambdas = dict() # key -> (lambda_low, lambda_high) of every pair solved
+        self.profile = []
+
+    def _solve(self, rec_f, rec_b):
+        self.lambdas[_key(rec_f)] = (min(rec_f.lambda1, rec_f.lambda2), max(rec_f.lambda1, rec_f.lambda2))
+        if rec_f.W.size == 0 or rec_b.W.size == 0:
+            return None
+        barMachine = BAR.BARestimator(rec_f.W, rec_b.W, self.Temp)
+        return barMachine.BARSC(float(rec_f.W.mean()))
+
+    def update(self):
+        self.fwd.poll()
+        self.bwd.poll()
+        done_f = {_key(rec): rec for rec in self.fwd.windows}
+        done_b = {_key(rec): rec for rec in self.bwd.windows}
+        for key in done_f.keys() & done_b.keys():
+            if key not in self.DF:
+                self.DF[key] = self._solve(done_f[key], done_b[key])
+        partial = dict()
+        cur_f = self.fwd.current()
+        cur_b = self.bwd.current()
+        for (cur, done) in ((cur_f, done_b), (cur_b, done_f)):
+            if cur is not None and _key(cur) in done:
+                pair = (cur, done[_key(cur)]) if cur is cur_f else (done[_key(cur)], cur)
+                partial[_key(cur)] = self._solve(*pair)
+        if cur_f is not None and cur_b is not None and _key(cur_f) == _key(cur_b):
+            partial[_key(cur_f)] = self._solve(cur_f, cur_b)
+        self.profile = []
+        F = 0.0
+        for key in sorted(set(self.DF) | set(partial)):
+            finished = key in self.DF
+            DF = self.DF[key] if finished else partial[key]
+            if DF is None:
+                continue
+            F += DF
+            self.profile.append(self.lambdas[key] + (DF, F, finished))
+        return self.profile
+
+    def checkpoint(self, fwd_path, bwd_path):
+        self.fwd.checkpoint(fwd_path)
+        self.bwd.checkpoint(bwd_path)
@@ -0,0 +1,93 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Parallel BAR estimation of many window pairs.
+-------------------------------------
+The work arrays of all window pairs are copied once into one block of shared memory, and only
+(offset, length) descriptions of them are sent to the worker processes, which attach to the block and run
+BARestimator on views of it. Each window is solved by exactly the same code and from the same initial guess
+as winPair.calcDF, so that the results are bitwise identical to the serial path.
+'''
+import os
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import BAR
+import fepLog
+
+ALIGN = 8 # array offsets in the shared block are multiples of 8 doubles (64 bytes)
+
+_shm = None # the shared block, attached once per worker process
+
+def _attach(name):
+    global _shm
+    _shm = shared_memory.SharedMemory(name = name)
+
+def _view(offset, size):
+    return np.ndarray((size,), dtype = np.float64, buffer = _shm.buf, offset = offset * 8)
+
+def _solve(task):
+    (i, off_f, n_f, off_r, n_r, T, DF0, convergence, MAXITER) = task
+    t0 = time.perf_counter()
+    barMachine = BAR.BARestimator(_view(off_f, n_f), _view(off_r, n_r), T)
+    DF = barMachine.BARSC(DF0, convergence, MAXITER)
+    return i, DF, barMachine.variance, barMachine.niter, barMachine.residual, time.perf_counter() - t0
+
+def lambdaOrder(pairs):
+    '''
+    Sort window pairs by the lower lambda value of the window.
+    '''
+    return sorted(pairs, key = lambda p: min(p.fwd_win.lambda1, p.fwd_win.lambda2))
+
+def parallelDF(pairs, workers = None, convergence = 1e-8, MAXITER = 1000):
+    '''
+    Estimate the free-energy change of every winPair in pairs, in a pool of worker processes.
+    -----------
+    pairs: a list of winPair
+    workers: number of worker processes, by default the number of CPUs
+    Each winPair gets its DF and error_F set, as by calcDF, from the same work (see winPair.works).
+    Return the profile in lambda order, as a list of tuples (lambda_low, lambda_high, DF, cumulative F).
+    '''
+    pairs = lambdaOrder(pairs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    arrays = []
+    for p in pairs:
+        arrays.extend(p.works()) # the uncorrelated subsamples if subsample() was called, as in calcDF
+    offsets = []
+    total = 0
+    for W in arrays:
+        offsets.append(total)
+        total += -(-len(W) // ALIGN) * ALIGN
+    shm = shared_memory.SharedMemory(create = True, size = max(total, 1) * 8)
+    try:
+        block = np.ndarray((total,), dtype = np.float64, buffer = shm.buf)
+        for (offset, W) in zip(offsets, arrays):
+            block[offset:offset + len(W)] = W
+        del block
+        tasks = []
+        for (i, p) in enumerate(pairs):
+            tasks.append((i, offsets[2 * i], len(arrays[2 * i]), offsets[2 * i + 1], len(arrays[2 * i + 1]),
+                          p.fwd_win.temperature, p.fwd_win.meanW, convergence, MAXITER))
+        with ProcessPoolExecutor(max_workers = workers, initializer = _attach, initargs = (shm.name,)) as pool:
+            for (i, DF, variance, niter, residual, seconds) in pool.map(_solve, tasks):
+                pairs[i].DF = DF
+                pairs[i].error_F = math.sqrt(variance)
+                fepLog.record('calcDF', seconds, window = pairs[i].label, iterations = niter, residual = residual,
+                              DF = DF, error = pairs[i].error_F)
+                fepLog.info("Free energy change for window [ %s ] calculated.", pairs[i].label)
+    finally:
+        shm.close()
+        shm.unlink()
+    profile = []
+    F = 0.0
+    for p in pairs:
+        F += p.DF
+        l = (p.fwd_win.lambda1, p.fwd_win.lambda2)
+        profile.append((min(l), max(l), p.DF, F))
+    return profile
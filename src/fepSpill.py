@@ -0,0 +1,114 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Out-of-core mode: work samples spilled to memory-mapped binary files.
+-------------------------------------
+With a spillDir given to fepReader.readWindows (or fepWin.bulkYield), the work of every window is written
+block by block to a raw float64 file while the fepout file is parsed, instead of being collected in memory.
+When the window is finished, its arrays are read-only np.memmap views of those files. The operating system
+then pages the samples in and out as BAR, histograms and bootstrap go through them, so that the memory used
+is bounded by the window pair being worked on, not by the whole file.
+
+Clean-up is automatic. On POSIX systems each file is unlinked as soon as it is mapped (its space is freed when
+the last view of it is gone). Elsewhere (Windows) a mapped file cannot be deleted, so each file is removed by a
+finalizer of its memory map, once the last array using it has been released, and the directory with the last
+of them. The temporary directory itself is removed by cleanup(), when the spillDir is garbage-collected, or at
+exit; files still mapped at that time are left to their finalizers.
+'''
+import os
+import mmap
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+def _release(path):
+    '''
+    Remove a spill file whose map is gone, and its directory if it was the last file in it.
+    '''
+    for remove in (os.remove, os.rmdir):
+        try:
+            remove(path)
+        except OSError: # still in use, or the directory is not empty yet
+            return
+        path = os.path.dirname(path)
+
+def release(data):
+    '''
+    Give back the pages of a spilled array that the process has read (e.g. for its mean and variance), so that
+    they stop counting in its resident memory; they are read again from the file if the array is used later.
+    Does nothing for other arrays, or where madvise is not available.
+    '''
+    if isinstance(data, np.memmap) and data._mmap is not None and hasattr(mmap, 'MADV_DONTNEED'):
+        data._mmap.madvise(mmap.MADV_DONTNEED)
+
+class spillWriter:
+    '''
+    The spill files of one window: one for the work and one for each extra column.
+    '''
+    def __init__(self, paths):
+        self.paths = paths
+        self.files = [open(path, 'wb') for path in paths]
+        self.n = 0
+
+    def append(self, data):
+        '''
+        Write one block of parsed data (the list of arrays returned by fepReader._parseBlock).
+        '''
+        for (outfile, column) in zip(self.files, data):
+            outfile.write(np.ascontiguousarray(column, dtype = np.float64).data)
+        self.n += len(data[0])
+
+    def finish(self):
+        '''
+        Close the files and return their read-only memory maps.
+        '''
+        for outfile in self.files:
+            outfile.close()
+        if self.n == 0:
+            arrays = [np.empty(0) for path in self.paths]
+        else:
+            arrays = [np.memmap(path, dtype = np.float64, mode = 'r', shape = (self.n,)) for path in self.paths]
+        if os.name == 'posix':
+            for path in self.paths:
+                os.remove(path)
+        else:
+            for (path, data) in zip(self.paths, arrays):
+                if isinstance(data, np.memmap):
+                    weakref.finalize(data._mmap, _release, path)
+                else:
+                    _release(path)
+        return arrays
+
+class spillDir:
+    '''
+    A temporary directory holding spill files.
+    dir: where to create it, by default the system temporary directory (TMPDIR)
+    '''
+    def __init__(self, dir = None):
+        self.path = tempfile.mkdtemp(prefix = 'fepspill-', dir = dir)
+        self.count = 0
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+
+    def writer(self, ncolumns = 1):
+        '''
+        A spillWriter for a new window with ncolumns arrays (the work first).
+        '''
+        self.count += 1
+        return spillWriter([os.path.join(self.path, 'win%d_%d.f8' % (self.count, i)) for i in range(ncolumns)])
+
+    def cleanup(self):
+        '''
+        Remove the directory. Arrays already mapped stay valid: on POSIX systems their files are already unlinked,
+        elsewhere the files still mapped are kept until their arrays are released.
+        '''
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
@@ -0,0 +1,97 @@
+__Author__ = "Yuncheng Mao"
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+Bounded-memory summaries of fep windows.
+-------------------------------------
+A winSummary is updated with each block of work values while the fepout file is read (see the summary
+argument of fepReader.readWindows). It keeps running moments (Welford's update, merged block by block),
+min/max, a histogram on a fixed grid, and the log-sum-exp of -W/kT, which is all the EXP estimate needs.
+With the raw samples discarded, reading a file takes memory in O(windows x bins), not O(samples).
+'''
+import math
+import numpy as np
+import BAR
+import Histogram
+
+class winSummary:
+    '''
+    Running statistics of the work of one window.
+    -----------
+    n, mean, M2: number of samples, mean, and sum of squared deviations from the mean
+    min, max: extreme values
+    lo, hi, counts: histogram on Nintervals equal bins of [lo, hi]; under and over count the samples outside
+    Temp: temperature of the EXP estimate
+    '''
+    def __init__(self, Temp, lo, hi, Nintervals = 250):
+        self.Temp = Temp
+        self.beta = 1.0 / (BAR.k_B * Temp)
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.lo = lo
+        self.hi = hi
+        self.counts = np.zeros(Nintervals, dtype = np.int64)
+        self.under = 0
+        self.over = 0
+        self._lse_m = -math.inf # log(sum(exp(-beta * W))) = _lse_m + log(_lse_s)
+        self._lse_s = 0.0
+
+    def update(self, block):
+        '''
+        Add a block of work values.
+        '''
+        nb = block.size
+        if nb == 0:
+            return
+        mean_b = float(block.mean())
+        d = block - mean_b
+        M2_b = float(np.dot(d, d))
+        n = self.n + nb
+        delta = mean_b - self.mean
+        self.mean += delta * nb / n
+        self.M2 += M2_b + delta * delta * self.n * nb / n
+        self.n = n
+        self.min = min(self.min, float(block.min()))
+        self.max = max(self.max, float(block.max()))
+        self.counts += Histogram.histCounts(block, self.lo, self.hi, self.counts.size)
+        self.under += int(np.count_nonzero(block < self.lo))
+        self.over += int(np.count_nonzero(block > self.hi))
+        np.multiply(block, -self.beta, out = d)
+        m = float(d.max())
+        if m > self._lse_m:
+            self._lse_s *= math.exp(self._lse_m - m)
+            self._lse_m = m
+        d -= self._lse_m
+        np.exp(d, out = d)
+        self._lse_s += float(d.sum())
+
+    def variance(self):
+        return self.M2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def EXP(self):
+        '''
+        EXP (Zwanzig) estimate of the free-energy change, -kT * log(mean(exp(-W/kT))).
+        '''
+        return -(self._lse_m + math.log(self._lse_s / self.n)) / self.beta
+
+    def hist(self):
+        '''
+        Return (x, P): bin centres and the normalized histogram.
+        '''
+        incr = (self.hi - self.lo) / self.counts.size
+        x = self.lo + incr * (0.5 + np.arange(self.counts.size))
+        return x, self.counts / max(self.n, 1)
+
+def factory(Temp, lo, hi, Nintervals = 250):
+    '''
+    A function making an empty winSummary for each new window, as expected by fepReader.readWindows.
+    '''
+    return lambda: winSummary(Temp, lo, hi, Nintervals)
@@ -0,0 +1,131 @@
+__Author__ = '''
+            Yuncheng Mao
+             '''
+__Email__ = '''
+            catmyc@gmail.com
+            maoyuncheng@mail.nankai.edu.cn
+            '''
+'''
+NumPy backend of the vector module.
+-------------------------------------
+Same functions as in vector, computed on arrays: element-wise functions return float64 arrays, reductions
+return floats, and no Python list is built. Lists are accepted as well and converted once.
+Reductions avoid full-size temporaries: vecdot and veclen2 are one dot product, and vecvar2 is one pass
+over the data, block by block, merging the block moments as in fepSummary (Chan et al.).
+vector imports this module when NumPy is available, and keeps its pure-Python functions otherwise.
+'''
+import math
+import numpy as np
+
+# the public vector API only: vector does 'from vecnumpy import *', and modules do 'from vector import *'
+__all__ = ['vecadd', 'vecaddsingle', 'vecinv', 'vecsub', 'vecsubsingle', 'vecdot', 'vecmul', 'vecmulsingle',
+           'veclen2', 'veclen', 'vecnorm', 'vecdist', 'vecsum', 'vecmean', 'vec_centralized', 'vecvar2', 'vecvar',
+           'vec_standardized']
+
+BLOCK = 1 << 16 # samples per block of the one-pass variance
+
+def _arr(vec):
+    return np.asarray(vec, dtype = np.float64)
+
+def vecadd(vec1, vec2):
+    if len(vec1) == len(vec2):
+        return np.add(vec1, vec2, dtype = np.float64)
+    else:
+        print("ERROR: Two vectors must be of equal length!!!")
+        return None
+
+def vecaddsingle(vec, num):
+    '''
+    add a same value to each element of the vector
+    '''
+    return np.add(vec, num, dtype = np.float64)
+
+def vecinv(vec):
+    return np.negative(vec, dtype = np.float64)
+
+def vecsub(vec1, vec2): # return vec1 - vec2
+    return np.subtract(vec1, vec2, dtype = np.float64)
+
+def vecsubsingle(vec, num):
+    '''
+    substract a same value from each element of the vector
+    '''
+    return np.subtract(vec, num, dtype = np.float64)
+
+def vecdot(vec1, vec2):
+    if len(vec1) == len(vec2):
+        return float(np.dot(_arr(vec1), _arr(vec2)))
+    else:
+        print("ERROR: Two vectors must be of equal length!!!")
+        return None
+
+def vecmul(vec1, vec2):
+    if len(vec1) == len(vec2):
+        return np.multiply(vec1, vec2, dtype = np.float64)
+    else:
+        print("ERROR: Two vectors must be of equal length!!!")
+        return None
+
+def vecmulsingle(vec, num):
+    return np.multiply(vec, num, dtype = np.float64)
+
+def veclen2(vec):
+    v = _arr(vec)
+    return float(np.dot(v, v))
+
+def veclen(vec):
+    return math.sqrt(veclen2(vec))
+
+def vecnorm(vec):
+    v = _arr(vec)
+    return v * (1.0 / math.sqrt(float(np.dot(v, v))))
+
+def vecdist(vec1, vec2):
+    return veclen(vecsub(vec1, vec2))
+
+def vecsum(vec):
+    return float(np.sum(vec, dtype = np.float64))
+
+def vecmean(vec):
+    return vecsum(vec) / len(vec)
+
+def vec_centralized(vec):
+    v = _arr(vec)
+    return v - v.mean()
+
+def _moments(vec):
+    '''
+    Return (n, mean, M2) of vec in one pass, M2 being the sum of squared deviations from the mean.
+    '''
+    v = np.asarray(vec)
+    n, mean, M2 = 0, 0.0, 0.0
+    scratch = np.empty(min(v.size, BLOCK))
+    for first in range(0, v.size, BLOCK):
+        block = v[first:first + BLOCK]
+        nb = block.size
+        d = scratch[:nb]
+        np.copyto(d, block)
+        mean_b = float(d.sum()) / nb
+        d -= mean_b
+        M2_b = float(np.dot(d, d))
+        delta = mean_b - mean
+        M2 += M2_b + delta * delta * n * nb / (n + nb)
+        n += nb
+        mean += delta * nb / n
+    return n, mean, M2
+
+def vecvar2(vec):
+    '''
+    mean squar variance
+    '''
+    (n, mean, M2) = _moments(vec)
+    return M2 / (n - 1)
+
+def vecvar(vec):
+    return math.sqrt(vecvar2(vec))
+
+def vec_standardized(vec):
+    (n, mean, M2) = _moments(vec)
+    v = _arr(vec) - mean
+    v *= 1.0 / math.sqrt(M2 / (n - 1))
+    return v
@@ -83,3 +83,9 @@ def vecvar(vec):
 def vec_standardized(vec):
     return vecmulsingle(vec_centralized(vec), 1.0 / vecvar(vec)) 
 
+
+try:
+    from vecnumpy import *
+    BACKEND = 'numpy'
+except ImportError: # no NumPy: keep the pure-Python functions above
+    BACKEND = 'python'